@@ -0,0 +1,126 @@
+# benchmarks/bench_dispatcher.py
+# Exercises the shared provider dispatcher against the local mock: coalescing of
+# identical requests across sessions, the in-flight cap, the token bucket, and
+# retries on 429s. Each scenario prints what reached the provider and how long
+# callers queued.
+# Run from the repo root: python benchmarks/bench_dispatcher.py
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mock_llm_server import MockConfig, MockLLMServer
+
+MESSAGES = [{"role": "system", "content": "You are a test."}, {"role": "user", "content": "What is your refund policy?"}]
+
+
+def make_engine(mock, limits=None):
+    from engine import ChatEngine
+
+    os.environ["OPENAI_BASE_URL"] = f"{mock.url}/v1"
+    engine = ChatEngine(openai_key="mock", provider_limits=limits)
+    engine.dispatcher.backoff = 0.05
+    return engine
+
+
+def queue_wait(engine):
+    for stage, model, count, mean, p95, _ in engine.metrics.stage_summary():
+        if stage == "queue_wait" and model == "openai":
+            return f"queue wait avg {mean * 1000:.0f}ms p95 {p95 * 1000:.0f}ms"
+    return "no queueing"
+
+
+def report(label, engine, mock, callers, elapsed, extra=""):
+    counters = engine.metrics.counters
+    print(
+        f"{label:<34} callers={callers:<4} provider requests={mock.requests:<4} "
+        f"max in flight={mock.max_in_flight:<3} coalesced={counters.get(('coalesced', 'openai'), 0):<4} "
+        f"retries={counters.get(('provider_retry', 'openai'), 0):<3} {elapsed * 1000:6.0f}ms  {queue_wait(engine)} {extra}"
+    )
+    engine.close()
+
+
+def run_threads(callers, fn):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        results = list(pool.map(fn, range(callers)))
+    return results, time.perf_counter() - start
+
+
+def identical_calls(callers=50):
+    with MockLLMServer(MockConfig(0.3, 200)) as mock:
+        engine = make_engine(mock)
+        results, elapsed = run_threads(callers, lambda _: engine.openai_completion(MESSAGES, 50))
+        assert len(set(results)) == 1
+        report("identical suggestion calls", engine, mock, callers, elapsed)
+
+
+def identical_streams(callers=20):
+    with MockLLMServer(MockConfig(0.3, 100)) as mock:
+        engine = make_engine(mock)
+        results, elapsed = run_threads(callers, lambda _: "".join(engine.openai_stream(MESSAGES)))
+        assert len(set(results)) == 1 and results[0]
+        report("identical streamed prompts", engine, mock, callers, elapsed)
+
+
+def identical_astreams(callers=50):
+    with MockLLMServer(MockConfig(0.3, 100)) as mock:
+        engine = make_engine(mock)
+
+        async def main():
+            async def one():
+                return "".join([chunk async for chunk in engine.openai_astream(MESSAGES)])
+            return await asyncio.gather(*(one() for _ in range(callers)))
+
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        assert len(set(results)) == 1 and results[0]
+        report("identical async streams", engine, mock, callers, time.perf_counter() - start)
+
+
+def concurrency_cap(callers=40, cap=4):
+    with MockLLMServer(MockConfig(0.1, 200)) as mock:
+        engine = make_engine(mock, {"openai": (cap, 1000.0, 1000)})
+        _, elapsed = run_threads(
+            callers, lambda i: engine.openai_completion(MESSAGES + [{"role": "user", "content": str(i)}], 50)
+        )
+        slots = engine.dispatcher.limiters["openai"].background_slots
+        report(f"background calls, {slots} of {cap} slots", engine, mock, callers, elapsed)
+
+
+def token_bucket(callers=30, rate=10.0, burst=5):
+    with MockLLMServer(MockConfig(0.05, 200)) as mock:
+        engine = make_engine(mock, {"openai": (100, rate, burst)})
+        _, elapsed = run_threads(
+            callers, lambda i: engine.openai_completion(MESSAGES + [{"role": "user", "content": str(i)}], 50)
+        )
+        # Background calls leave the interactive reserve of the burst untouched
+        usable = burst - engine.dispatcher.limiters["openai"].background_token_floor
+        report(f"background calls, {rate:.0f}/s burst {burst}", engine, mock, callers, elapsed,
+               f"(expected ~{(callers - usable) / rate * 1000:.0f}ms)")
+
+
+def rate_limited(callers=10, failures=6):
+    with MockLLMServer(MockConfig(0.05, 200, rate_limit_first=failures)) as mock:
+        engine = make_engine(mock)
+        results, elapsed = run_threads(
+            callers, lambda i: "".join(engine.openai_stream(MESSAGES + [{"role": "user", "content": str(i)}]))
+        )
+        assert all(results)
+        report(f"first {failures} requests get 429", engine, mock, callers, elapsed)
+
+
+def main():
+    identical_calls()
+    identical_streams()
+    identical_astreams()
+    concurrency_cap()
+    token_bucket()
+    rate_limited()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_hedging.py
+# Races the real OpenAI and Gemini SDK clients against two local mock providers
+# and reports which one won and how long the first token took.
+# Run from the repo root: python benchmarks/bench_hedging.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+from google import genai
+from openai import OpenAI
+
+from hedging import HedgedStream
+from mock_llm_server import MockConfig, MockLLMServer
+from providers import gemini_text_stream, openai_text_stream, track_response
+
+MESSAGES = [{"role": "system", "content": "You are a test."}, {"role": "user", "content": "Say something."}]
+CONTENTS = [{"role": "user", "parts": [{"text": "Say something."}]}]
+
+# (label, OpenAI mock config, Gemini mock config, hedge delay)
+SCENARIOS = [
+    ("preferred is fast", MockConfig(0.1, 200), MockConfig(0.1, 200), 0.5),
+    ("preferred is slow", MockConfig(2.0, 200), MockConfig(0.1, 200), 0.3),
+    ("both slow, hedge helps", MockConfig(1.5, 200), MockConfig(0.8, 200), 0.3),
+    ("preferred out of quota", MockConfig(0.05, fail_status=429), MockConfig(0.2, 200), 2.0),
+]
+
+
+def run(label, openai_config, gemini_config, hedge_delay):
+    with MockLLMServer(openai_config) as openai_mock, MockLLMServer(gemini_config) as gemini_mock:
+        # The response hook lets the loser's connection be shut down as soon as the race is decided
+        hooks = {"response": [track_response]}
+        openai_client = OpenAI(
+            api_key="mock", base_url=f"{openai_mock.url}/v1", max_retries=0,
+            http_client=httpx.Client(event_hooks=hooks),
+        )
+        gemini_client = genai.Client(
+            api_key="mock", http_options={"base_url": gemini_mock.url, "httpx_client": httpx.Client(event_hooks=hooks)}
+        )
+
+        stream = HedgedStream(
+            [
+                ("openai", lambda: openai_text_stream(openai_client, "gpt-3.5-turbo", MESSAGES)),
+                ("gemini", lambda: gemini_text_stream(gemini_client, "gemini-1.5-flash", CONTENTS, "test")),
+            ],
+            hedge_delay=hedge_delay,
+        )
+        start = time.perf_counter()
+        text = "".join(stream)
+        total = time.perf_counter() - start
+        # Give the losing stream a moment to notice it was dropped
+        time.sleep(0.2)
+
+        print(
+            f"{label:<26} winner={stream.provider:<7} ttft={stream.first_token_at * 1000:7.1f}ms "
+            f"total={total * 1000:7.1f}ms chars={len(text):4d} "
+            f"requests={openai_mock.requests}/{gemini_mock.requests} cancelled={openai_mock.cancelled}/{gemini_mock.cancelled} "
+            f"errors={sorted(stream.errors)}"
+        )
+
+
+def main():
+    for scenario in SCENARIOS:
+        run(*scenario)
+
+
+if __name__ == "__main__":
+    main()
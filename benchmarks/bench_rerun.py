@@ -0,0 +1,73 @@
+# benchmarks/bench_rerun.py
+# Per-rerun cost of bot.py as the conversation grows. With the windowed history
+# view the numbers should stay flat from short chats to very long ones.
+# Run from the repo root: python benchmarks/bench_rerun.py
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from mock_llm_server import start_mock_process
+
+FEEDBACK_DB = os.path.join(ROOT, ".bench_rerun_feedback.sqlite3")
+
+
+def conversation(length):
+    from data_config import SYSTEM_PROMPT
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for index in range(length):
+        role = "user" if index % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"Message {index}: " + "some **markdown** text " * 20})
+    return messages
+
+
+def time_reruns(length, reruns):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "bot.py"), default_timeout=60)
+    app.session_state["messages"] = conversation(length)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - start)
+    return samples, len(app.chat_message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bot.py rerun time against history length")
+    parser.add_argument("--lengths", default="10,200,2000")
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    process, mock_url = start_mock_process()
+    os.environ.update(
+        OPENAI_API_KEY="mock",
+        OPENAI_BASE_URL=f"{mock_url}/v1",
+        GOOGLE_GEMINI_BASE_URL=mock_url,
+        FEEDBACK_DB_PATH=FEEDBACK_DB,
+    )
+    try:
+        print(f"{'messages':>9} {'rendered':>9} {'rerun p50 ms':>13} {'rerun max ms':>13}")
+        for length in (int(n) for n in args.lengths.split(",")):
+            samples, rendered = time_reruns(length, args.reruns)
+            print(f"{length:>9} {rendered:>9} {statistics.median(samples) * 1000:>13.1f} {max(samples) * 1000:>13.1f}")
+    finally:
+        process.terminate()
+        process.wait()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(FEEDBACK_DB + suffix):
+                os.remove(FEEDBACK_DB + suffix)
+
+
+if __name__ == "__main__":
+    main()
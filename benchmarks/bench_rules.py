@@ -0,0 +1,70 @@
+# benchmarks/bench_rules.py
+# Compares the compiled RuleEngine against the original linear re.search scan.
+# Run from the repo root: python benchmarks/bench_rules.py
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from data_config import BOT_RULES
+from rule_engine import RuleEngine
+
+
+def legacy_rule_response(rules, user_input):
+    """The original get_rule_based_response loop from bot.py."""
+    user_input = user_input.lower()
+    for pattern, response in rules.items():
+        if re.search(pattern, user_input):
+            return response
+    return None
+
+
+def synthetic_rules(count, rng):
+    """BOT_RULES padded with random keyword rules that real prompts rarely hit."""
+    rules = dict(BOT_RULES)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    while len(rules) < count:
+        words = ["".join(rng.choice(letters) for _ in range(rng.randint(6, 10))) for _ in range(3)]
+        rules["|".join(words)] = f"Synthetic answer {len(rules)}"
+    return rules
+
+
+def sample_prompts(count, rng):
+    vocabulary = " ".join(BOT_RULES).replace("|", " ").split()
+    vocabulary += ["please", "tell", "me", "about", "the", "weather", "today", "invoice", "refund"]
+    return [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 25))) for _ in range(count)]
+
+
+def timed(fn, prompts):
+    start = time.perf_counter()
+    for prompt in prompts:
+        fn(prompt)
+    return time.perf_counter() - start
+
+
+def main():
+    rng = random.Random(42)
+    prompts = sample_prompts(2000, rng)
+
+    print(f"{'rules':>7} {'legacy us/prompt':>17} {'engine us/prompt':>17} {'speedup':>8}")
+    for count in (len(BOT_RULES), 1000, 5000):
+        rules = synthetic_rules(count, rng)
+        engine = RuleEngine(rules)
+
+        # Both implementations must agree on every prompt before timing means anything
+        for prompt in prompts:
+            assert engine.match(prompt) == legacy_rule_response(rules, prompt), prompt
+
+        legacy_time = timed(lambda p: legacy_rule_response(rules, p), prompts)
+        engine_time = timed(engine.match, prompts)
+        print(
+            f"{len(rules):>7} {legacy_time / len(prompts) * 1e6:>17.1f} "
+            f"{engine_time / len(prompts) * 1e6:>17.1f} {legacy_time / engine_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_server_load.py
+# Load test for server.py: many concurrent chat sessions streaming through the
+# engine's pooled async clients, against the local mock provider.
+# Run from the repo root: python benchmarks/bench_server_load.py
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+from mock_llm_server import MockConfig, start_mock_process
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_session(client, url, session_index, turns, results):
+    session_id = f"load-{session_index}"
+    for turn in range(turns):
+        # Prompts that miss every BOT_RULES pattern and the response cache
+        payload = {"session_id": session_id, "message": f"qzx {session_index} {turn} wvk"}
+        start = time.perf_counter()
+        first_token = None
+        async with client.stream("POST", f"{url}/v1/chat", json=payload) as response:
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith("event: token"):
+                    first_token = time.perf_counter() - start
+        results.append((first_token or 0.0, time.perf_counter() - start))
+
+
+async def run_level(url, concurrency, turns):
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(client, url, i, turns, results) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    ttft = [r[0] for r in results]
+    total = [r[1] for r in results]
+    print(
+        f"{concurrency:>11} {len(results):>6} {len(results) / elapsed:>8.1f} "
+        f"{statistics.median(ttft) * 1000:>9.0f} {percentile(ttft, 0.95) * 1000:>9.0f} "
+        f"{statistics.median(total) * 1000:>10.0f} {percentile(total, 0.95) * 1000:>10.0f}"
+    )
+
+
+async def main(levels, args):
+    process, mock_url = start_mock_process(
+        MockConfig(args.first_token_delay, args.tokens_per_second, args.response_tokens)
+    )
+    try:
+        # The engine's clients pick the mock up through the SDKs' base-URL variables
+        os.environ["OPENAI_BASE_URL"] = f"{mock_url}/v1"
+        os.environ["GOOGLE_GEMINI_BASE_URL"] = mock_url
+
+        from engine import ChatEngine
+        from server import ChatServer
+
+        unlimited = {provider: (1000, 1e6, 1e6) for provider in ("openai", "gemini")}
+        engine = ChatEngine(
+            openai_key="mock", google_key="mock", max_connections=max(levels) * 2, provider_limits=unlimited
+        )
+        server = await ChatServer(engine, port=0).start()
+        url = f"http://127.0.0.1:{server.port}"
+
+        print(
+            f"mock provider: first token {args.first_token_delay * 1000:.0f}ms, "
+            f"{args.tokens_per_second:.0f} tokens/s, {args.response_tokens} tokens per answer"
+        )
+        print(f"{'concurrency':>11} {'turns':>6} {'turns/s':>8} {'ttft p50':>9} {'ttft p95':>9} "
+              f"{'total p50':>10} {'total p95':>10}")
+        for concurrency in levels:
+            await run_level(url, concurrency, args.turns)
+        await server.close()
+        engine.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for server.py")
+    parser.add_argument("--levels", default="1,10,50,100")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--response-tokens", type=int, default=30)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    asyncio.run(main(levels, args))
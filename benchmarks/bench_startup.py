@@ -0,0 +1,126 @@
+# benchmarks/bench_startup.py
+# Cold-start budget for bot.py: import time of the app's modules, and a fresh
+# process rendering the page and answering one BOT_RULES prompt with no document.
+# Fails (exit 1) if the first render is over budget or that session loaded the
+# PDF or Gemini libraries.
+#
+# Run from the repo root: python benchmarks/bench_startup.py --budget-ms 1500
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from mock_llm_server import start_mock_process
+
+# What bot.py imports besides streamlit itself
+APP_MODULES = ["dotenv", "data_config", "engine", "document_library", "feedback_store"]
+
+# Must stay unloaded in a session without a document that only hits BOT_RULES
+FORBIDDEN = ["fitz", "pymupdf", "google.genai"]
+# Reported, but allowed: openai is loaded in the background for follow-up suggestions
+WATCHED = FORBIDDEN + ["openai", "tiktoken", "numpy"]
+
+
+def import_times():
+    """(module, cumulative microseconds) for every top-level import of the app, slowest first."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(APP_MODULES)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Top-level imports are the ones importtime doesn't indent
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            times.append((name.strip(), int(cumulative)))
+    return sorted(times, key=lambda item: -item[1])
+
+
+def run_session(mock_url):
+    """Runs child_session() in a fresh interpreter and returns its report."""
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="mock",
+        GOOGLE_API_KEY="mock",
+        OPENAI_BASE_URL=f"{mock_url}/v1",
+        GOOGLE_GEMINI_BASE_URL=mock_url,
+        FEEDBACK_DB_PATH=os.path.join(ROOT, ".bench_startup_feedback.sqlite3"),
+    )
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def child_session():
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "bot.py"), default_timeout=60)
+    start = time.perf_counter()
+    app.run()
+    first_render = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app.chat_input[0].set_value("hi there").run()
+    rule_turn = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    print(json.dumps({
+        "first_render_ms": first_render * 1000,
+        "rule_turn_ms": rule_turn * 1000,
+        "loaded": {name: name in sys.modules for name in WATCHED},
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start budget for bot.py")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="limit for the first page render")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    times = import_times()
+    print(f"{'import':<40} {'cumulative ms':>14}")
+    for name, micros in times[:args.top]:
+        print(f"{name:<40} {micros / 1000:>14.1f}")
+    app_total = sum(micros for name, micros in times if name in APP_MODULES)
+    print(f"{'app modules total':<40} {app_total / 1000:>14.1f}\n")
+
+    process, mock_url = start_mock_process()
+    try:
+        report = run_session(mock_url)
+    finally:
+        process.terminate()
+        process.wait()
+        for suffix in ("", "-wal", "-shm"):
+            path = os.path.join(ROOT, ".bench_startup_feedback.sqlite3" + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    print(f"first render      {report['first_render_ms']:8.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"rule-only turn    {report['rule_turn_ms']:8.1f} ms")
+    print("loaded modules    " + ", ".join(f"{name}={'yes' if loaded else 'no'}" for name, loaded in report["loaded"].items()))
+
+    failures = []
+    if report["first_render_ms"] > args.budget_ms:
+        failures.append(f"first render took {report['first_render_ms']:.0f} ms")
+    failures += [f"{name} was loaded" for name in FORBIDDEN if report["loaded"][name]]
+    if failures:
+        print("OVER BUDGET: " + "; ".join(failures))
+        sys.exit(1)
+    print("within budget")
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child_session()
+    else:
+        main()
@@ -0,0 +1,290 @@
+# benchmarks/bench_suite.py
+# Offline benchmark suite: rule matching, document extraction, memory compression
+# and full chat turns, all against the local mock provider, so no API credits or
+# network are needed. Reports throughput and p50/p95/p99 latency per scenario.
+#
+# Run from the repo root:
+#   python benchmarks/bench_suite.py                       # every scenario
+#   python benchmarks/bench_suite.py --only rules,turns    # a subset
+#   python benchmarks/bench_suite.py --save baseline.json
+#   python benchmarks/bench_suite.py --compare baseline.json
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mock_llm_server import MockConfig, start_mock_process
+
+# Slower than this on p50 or throughput, compared to --compare, is flagged
+REGRESSION_THRESHOLD = 0.20
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Result:
+    """Latency samples for one scenario, in seconds, plus the wall time they took."""
+
+    def __init__(self, name, samples, elapsed):
+        self.name = name
+        self.samples = samples
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        return len(self.samples) / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "n": len(self.samples),
+            "ops_per_s": self.throughput,
+            "p50_ms": percentile(self.samples, 0.50) * 1000,
+            "p95_ms": percentile(self.samples, 0.95) * 1000,
+            "p99_ms": percentile(self.samples, 0.99) * 1000,
+        }
+
+
+def measure(name, calls):
+    """Times each zero-argument callable separately and the whole batch end to end."""
+    samples = []
+    start = time.perf_counter()
+    for call in calls:
+        call_start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - call_start)
+    return Result(name, samples, time.perf_counter() - start)
+
+
+# --- Scenarios ---
+
+def bench_rules(engine, args):
+    """get_rule_based_response over mixed prompts, with BOT_RULES and with thousands of rules."""
+    from bench_rules import sample_prompts, synthetic_rules
+    from rule_engine import RuleEngine
+
+    rng = random.Random(7)
+    prompts = sample_prompts(args.rule_prompts, rng)
+    results = [measure(f"rules x{len(engine.rules.responses)}", [lambda p=p: engine.get_rule_based_response(p) for p in prompts])]
+
+    large = RuleEngine(synthetic_rules(5000, rng))
+    results.append(measure("rules x5000", [lambda p=p: large.match(p) for p in prompts]))
+    return results
+
+
+def make_pdf(pages):
+    """A generated PDF of `pages` pages of wrapped prose, as bytes."""
+    import fitz
+
+    rng = random.Random(pages)
+    words = "the contract states that each party shall deliver invoices refunds shipping support office".split()
+    document = fitz.open()
+    for number in range(pages):
+        page = document.new_page()
+        text = "\n".join(" ".join(rng.choice(words) for _ in range(14)) for _ in range(45))
+        page.insert_textbox(fitz.Rect(50, 50, 560, 800), f"Page {number + 1}\n{text}", fontsize=9)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+class FakeUpload(io.BytesIO):
+    """Just enough of Streamlit's UploadedFile for the ingestion path."""
+
+    type = "application/pdf"
+
+
+def bench_extraction(engine, args):
+    """bot.py's upload path (spool, hash, extract to disk, index) on PDFs of several sizes, then library search."""
+    from document_library import DocumentLibrary, DocumentStore
+
+    def ingest(upload, store):
+        key = store.add(upload)
+        store.wait(key)
+        return key
+
+    def ingest_cold(upload):
+        # A fresh store per sample so nothing is cached; closing it stops its threads and removes its temp dir
+        store = DocumentStore()
+        try:
+            ingest(upload, store)
+        finally:
+            store.close()
+
+    def ingest_together(uploads):
+        store = DocumentStore()
+        try:
+            for key in [store.add(upload) for upload in uploads]:
+                store.wait(key)
+        finally:
+            store.close()
+
+    results = []
+    shared = DocumentStore()
+    documents = []
+    for pages in args.pdf_pages:
+        upload = FakeUpload(make_pdf(pages))
+        # Warm the process pool once so the first sample isn't paying for worker startup
+        ingest_cold(upload)
+        results.append(measure(f"ingest {pages}p cold", [lambda: ingest_cold(upload)] * args.extract_runs))
+        documents.append((f"{pages}p.pdf", ingest(upload, shared)))
+        results.append(measure(f"ingest {pages}p cached", [lambda: ingest(upload, shared)] * args.extract_runs))
+
+    # Several different uploads at once, as a user dropping a folder of contracts would
+    uploads = [FakeUpload(make_pdf(pages)) for pages in range(20, 20 + args.library_size)]
+    results.append(measure(f"ingest {len(uploads)} docs at once", [lambda: ingest_together(uploads)] * args.extract_runs))
+
+    library = DocumentLibrary(shared, documents)
+    queries = ["refund policy for invoices", "which party delivers shipping", "office support contract", "zzz"]
+    results.append(measure(
+        f"library top_chunks x{len(library)}", [lambda q=q: library.top_chunks(q) for q in queries * 25]
+    ))
+    shared.close()
+    return results
+
+
+def long_history(length, rng):
+    topics = ["saturn", "shipping", "refund policy", "the office", "python decorators", "pizza toppings"]
+    history = []
+    for index in range(length):
+        role = "user" if index % 2 == 0 else "assistant"
+        sentence = f"Let's talk about {rng.choice(topics)} " + " ".join(rng.choice(topics) for _ in range(20))
+        history.append({"role": role, "content": sentence})
+    return history
+
+
+def bench_memory(engine, args):
+    """compress_memory over long histories, for both providers against the mock."""
+    from engine import GEMINI_CHOICE, OPENAI_CHOICE
+
+    rng = random.Random(11)
+    results = []
+    for length in args.history_lengths:
+        history = long_history(length, rng)
+        for label, choice in (("openai", OPENAI_CHOICE), ("gemini", GEMINI_CHOICE)):
+            results.append(measure(
+                f"compress {length}msg {label}",
+                [lambda: engine.compress_memory(history, "Earlier summary.", choice)] * args.memory_runs,
+            ))
+    return results
+
+
+def bench_turns(engine, args):
+    """Full turns through the engine: new prompts, repeated prompts and rule matches."""
+    from engine import ChatSession, GEMINI_CHOICE, OPENAI_CHOICE
+
+    def turn(session, prompt, model_choice, first_tokens):
+        plan = engine.prepare_turn(session, prompt, "Witty & Spicy", model_choice)
+        start = time.perf_counter()
+        parts = []
+        for chunk in engine.stream_turn(plan):
+            if not parts:
+                first_tokens.append(time.perf_counter() - start)
+            parts.append(chunk)
+        engine.complete_turn(session, plan, "".join(parts))
+
+    results = []
+    for label, choice in (("openai", OPENAI_CHOICE), ("gemini", GEMINI_CHOICE)):
+        session = ChatSession()
+        first_tokens = []
+        # Prompts that miss every BOT_RULES pattern
+        prompts = [f"qzx {label} {i} wvk" for i in range(args.turns)]
+        results.append(measure(f"turn model {label}", [lambda p=p: turn(session, p, choice, first_tokens) for p in prompts]))
+        results.append(Result(f"turn ttft {label}", first_tokens, results[-1].elapsed))
+
+        # Fresh session, same prompts: every answer comes from the response cache
+        session = ChatSession()
+        results.append(measure(f"turn cached {label}", [lambda p=p: turn(session, p, choice, []) for p in prompts]))
+
+    session = ChatSession()
+    results.append(measure("turn rule", [lambda: turn(session, "hi, where is your office?", OPENAI_CHOICE, [])] * args.turns))
+    return results
+
+
+SCENARIOS = {
+    "rules": bench_rules,
+    "extraction": bench_extraction,
+    "memory": bench_memory,
+    "turns": bench_turns,
+}
+
+
+def print_results(results, baseline):
+    print(f"{'scenario':<28} {'n':>5} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  change")
+    for result in results:
+        row = result.as_dict()
+        change = ""
+        previous = baseline.get(result.name)
+        if previous:
+            p50_change = row["p50_ms"] / previous["p50_ms"] - 1 if previous["p50_ms"] else 0.0
+            regressed = p50_change > REGRESSION_THRESHOLD or (
+                previous["ops_per_s"] and row["ops_per_s"] < previous["ops_per_s"] * (1 - REGRESSION_THRESHOLD)
+            )
+            change = f"p50 {p50_change:+.0%}" + ("  REGRESSION" if regressed else "")
+        print(
+            f"{result.name:<28} {row['n']:>5} {row['ops_per_s']:>10.1f} {row['p50_ms']:>9.2f} "
+            f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}  {change}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite against a mock LLM provider")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier --save to compare against")
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--rule-prompts", type=int, default=5000)
+    parser.add_argument("--pdf-pages", default="5,50,300")
+    parser.add_argument("--extract-runs", type=int, default=5)
+    parser.add_argument("--library-size", type=int, default=4)
+    parser.add_argument("--history-lengths", default="50,500,2000")
+    parser.add_argument("--memory-runs", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+    args.pdf_pages = [int(n) for n in args.pdf_pages.split(",")]
+    args.history_lengths = [int(n) for n in args.history_lengths.split(",")]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)["results"]
+
+    config = MockConfig(args.first_token_delay, args.tokens_per_second, args.response_tokens)
+    process, mock_url = start_mock_process(config)
+    try:
+        # The engine's SDK clients pick the mock up through their base-URL variables
+        os.environ["OPENAI_BASE_URL"] = f"{mock_url}/v1"
+        os.environ["GOOGLE_GEMINI_BASE_URL"] = mock_url
+        from engine import ChatEngine
+
+        # No provider rate limits: the suite measures the pipeline, not the throttle
+        unlimited = {provider: (1000, 1e6, 1e6) for provider in ("openai", "gemini")}
+        engine = ChatEngine(openai_key="mock", google_key="mock", provider_limits=unlimited)
+        print(
+            f"mock provider: first token {config.first_token_delay * 1000:.0f}ms, "
+            f"{config.tokens_per_second:.0f} tokens/s, {config.response_tokens} tokens per answer"
+        )
+        results = []
+        for name in args.only.split(","):
+            results.extend(SCENARIOS[name](engine, args))
+        engine.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as handle:
+            json.dump({"mock": vars(config), "results": {r.name: r.as_dict() for r in results}}, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# benchmarks/mock_llm_server.py
+# Local stand-in for the OpenAI chat-completions and Gemini generateContent APIs,
+# streaming or not, with configurable latency, token rate and failures.
+#
+# Run standalone:  python benchmarks/mock_llm_server.py --port 8900 --first-token-delay 0.4
+# Then point the SDKs at it:
+#   OpenAI(api_key="mock", base_url="http://127.0.0.1:8900/v1")
+#   genai.Client(api_key="mock", http_options={"base_url": "http://127.0.0.1:8900"})
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUOTA_ERROR = {
+    "error": {
+        "message": "You exceeded your current quota, please check your plan and billing details.",
+        "type": "insufficient_quota",
+        "code": "insufficient_quota",
+    }
+}
+
+RATE_LIMIT_ERROR = {
+    "error": {
+        "message": "Rate limit reached for requests. Please try again in 100ms.",
+        "type": "requests",
+        "code": "rate_limit_exceeded",
+    }
+}
+
+
+class MockConfig:
+    def __init__(self, first_token_delay=0.2, tokens_per_second=50.0, response_tokens=40, fail_status=None,
+                 rate_limit_first=0):
+        self.first_token_delay = first_token_delay
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.fail_status = fail_status  # e.g. 429 to answer every request with a quota error
+        self.rate_limit_first = rate_limit_first  # answer this many requests with a retryable 429 first
+
+
+def response_tokens(count):
+    words = ["Zfluffy", "says", "the", "answer", "is", "spicy", "but", "accurate", "and", "well", "formatted"]
+    return [words[i % len(words)] + " " for i in range(count)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        with self.server.lock:
+            self.server.requests += 1
+            number = self.server.requests
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            self._answer(number)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _answer(self, number):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?")[0]
+
+        if self.config.fail_status:
+            return self._send_json(self.config.fail_status, QUOTA_ERROR)
+        if number <= self.config.rate_limit_first:
+            return self._send_json(429, RATE_LIMIT_ERROR, {"Retry-After": "0.1"})
+
+        if path.endswith("/chat/completions"):
+            if body.get("stream"):
+                return self._stream(self._openai_chunk, body.get("model", "gpt-3.5-turbo"), "data: [DONE]\n\n")
+            return self._send_json(200, self._openai_completion(body))
+        if path.endswith(":streamGenerateContent"):
+            return self._stream(self._gemini_chunk, None, None)
+        if path.endswith(":generateContent"):
+            return self._send_json(200, self._gemini_response("".join(self._tokens())))
+        self._send_json(404, {"error": {"message": f"unknown path {path}"}})
+
+    def _tokens(self):
+        return response_tokens(self.config.response_tokens)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        time.sleep(self.config.first_token_delay)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, make_chunk, model, terminator):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(self.config.first_token_delay)
+        interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        try:
+            for token in self._tokens():
+                self.wfile.write(f"data: {json.dumps(make_chunk(token, model))}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if interval:
+                    time.sleep(interval)
+            if terminator:
+                self.wfile.write(terminator.encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early, e.g. a hedged request that lost the race
+            self.server.cancelled += 1
+
+    @staticmethod
+    def _openai_chunk(token, model):
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}],
+        }
+
+    def _openai_completion(self, body):
+        content = "".join(self._tokens())
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": self.config.response_tokens, "total_tokens": 0},
+        }
+
+    @staticmethod
+    def _gemini_response(text):
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}]}
+
+    @classmethod
+    def _gemini_chunk(cls, token, model):
+        return cls._gemini_response(token)
+
+
+class MockLLMServer:
+    """A mock provider on a background thread. Use as a context manager or call start()/stop()."""
+
+    def __init__(self, config=None, port=0):
+        handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.cancelled = 0
+        self.httpd.in_flight = 0
+        self.httpd.max_in_flight = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def config(self):
+        return self.httpd.RequestHandlerClass.config
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def cancelled(self):
+        return self.httpd.cancelled
+
+    @property
+    def max_in_flight(self):
+        return self.httpd.max_in_flight
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_process(config=None):
+    """Runs a mock provider in its own process so it doesn't share a GIL with the code under test.
+
+    Returns (process, url); the caller terminates the process.
+    """
+    config = config or MockConfig()
+    port = free_port()
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--port", str(port),
+        "--first-token-delay", str(config.first_token_delay),
+        "--tokens-per-second", str(config.tokens_per_second),
+        "--response-tokens", str(config.response_tokens),
+    ]
+    if config.fail_status:
+        command += ["--fail-status", str(config.fail_status)]
+    if config.rate_limit_first:
+        command += ["--rate-limit-first", str(config.rate_limit_first)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock provider did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI and Gemini streaming APIs")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--fail-status", type=int, default=None)
+    parser.add_argument("--rate-limit-first", type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        args.first_token_delay, args.tokens_per_second, args.response_tokens, args.fail_status, args.rate_limit_first
+    )
+    server = MockLLMServer(config, port=args.port)
+    print(f"Mock LLM provider listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,15 @@
+import time
+script_start = time.perf_counter()
+
 import streamlit as st
-import re
 import os
-import fitz
-import csv
-from openai import OpenAI
-from google import genai 
+import uuid
 from dotenv import load_dotenv
-from datetime import datetime
 
-from data_config import BOT_RULES, SYSTEM_PROMPT
+from data_config import SYSTEM_PROMPT
+from engine import ChatEngine, DEFAULT_SUGGESTIONS, init_session
+from document_library import DocumentLibrary, DocumentStore
+from feedback_store import FeedbackStore
 
 # 1. Environment Setup
 env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -17,39 +18,56 @@ load_dotenv(dotenv_path=env_path)
 api_key = os.getenv("OPENAI_API_KEY")
 google_key = os.getenv("GOOGLE_API_KEY")
 
-if google_key:
-    gemini_client = genai.Client(api_key=google_key)
-
 if not api_key:
     st.error("API Key not found! Please check your .env file.")
     st.stop()
 
-openai_client = OpenAI(api_key=api_key)
+# 2. The chat pipeline (rules, memory, context, caching, providers) lives in engine.py
+@st.cache_resource
+def get_engine():
+    # One engine per process, shared by every session and rerun; its SDK clients are built on first use
+    return ChatEngine.from_env()
 
-# 2. Rule-Based Logic
-def get_rule_based_response(user_input):
-    user_input = user_input.lower()
-    for pattern, response in BOT_RULES.items():
-        if re.search(pattern, user_input):
-            return response
-    return None
+engine = get_engine()
+metrics = engine.metrics
+# Imports and engine setup: the first run of a process is the cold start, later reruns should be near zero
+metrics.observe("script_setup", time.perf_counter() - script_start)
 
 # 3. Streamlit UI Layout
 st.set_page_config(page_title="Hybrid Chatbot", page_icon="🤖")
 st.title("🤖 Zfluffy Spicy AI")
 
-# Initialize chat history (Memory)
-if "messages" not in st.session_state:
-    st.session_state.messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+# Initialize chat history (Memory) and the rest of the engine's per-session state
+init_session(st.session_state)
+
+if "upload_keys" not in st.session_state:
+    # file_id -> content key in the document store; the text itself stays on disk
+    st.session_state.upload_keys = {}
+
+# Only the newest messages are rendered on each rerun; "Load earlier" widens the window
+HISTORY_WINDOW = 20
+
+if "history_window" not in st.session_state:
+    st.session_state.history_window = HISTORY_WINDOW
 
-def extract_text_from_file(uploaded_file):
-    if uploaded_file.type == "application/pdf":
-        doc = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-        text = "".join([page.get_text() for page in doc])
-        return text
-    elif uploaded_file.type == "text/plain":
-        return str(uploaded_file.read(), "utf-8")
-    return ""
+@st.cache_resource
+def get_document_store():
+    # One store for the whole process: uploads are ingested in the background and
+    # shared by every session that uploads the same file
+    return DocumentStore(
+        os.getenv("DOCUMENT_STORE_PATH"),
+        max_bytes=int(os.getenv("DOCUMENT_STORE_MAX_MB", "1024")) * 1024 * 1024,
+        max_index_bytes=int(os.getenv("DOCUMENT_INDEX_MAX_MB", "256")) * 1024 * 1024,
+        metrics=metrics,
+    )
+
+STATUS_ICONS = {"queued": "⏳", "extracting": "⏳", "indexing": "⏳", "ready": "✅", "failed": "❌", "evicted": "⏳"}
+
+def iter_transcript(messages):
+    """Yields the plain-text export one message at a time."""
+    for m in messages:
+        if m["role"] != "system":
+            yield f"{m['role'].upper()}: {m['content']}\n"
 
 with st.sidebar:
     st.header("⚙️ Settings")
@@ -64,9 +82,23 @@ with st.sidebar:
         ("Open AI (GPT-4o)", "Google Gemini (Free Tier)"),
         index=0 if api_key else 1
     )
+    # Race both providers: the chosen one first, the other after HEDGE_DELAY seconds or on error
+    fastest_mode = st.toggle(
+        "⚡ Fastest mode (race both providers)",
+        value=False,
+        disabled=not google_key,
+        help="Needs both an OpenAI and a Google API key.",
+    )
 
     if st.button("Clear Chat History", use_container_width=True):
         st.session_state.messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        st.session_state.chat_summary = ""
+        st.session_state.summarized_upto = 1
+        st.session_state.summary_job = None
+        st.session_state.history_window = HISTORY_WINDOW
+        # A fresh conversation gets a fresh feedback key space
+        st.session_state.feedback = {}
+        st.session_state.session_id = uuid.uuid4().hex
         st.toast("Chat history cleared!", icon="🧹")
         st.rerun()
 
@@ -75,31 +107,74 @@ with st.sidebar:
         if st.button("🔄 Regenerate Last Response", use_container_width=True):
             # Remove the last assistant response
             if st.session_state.messages[-1]["role"] == "assistant":
-                st.session_state.messages.pop()
+                engine.truncate_history(st.session_state, len(st.session_state.messages) - 1)
                 st.rerun()
 
     st.divider()
 
     st.header("📄 Document Analysis")
-    uploaded_file = st.file_uploader("Upload a PDF or TXT file", type=["pdf", "txt"])
-    
-    doc_context = ""
-    if uploaded_file:
-        with st.spinner("Reading document..."):
-            doc_context = extract_text_from_file(uploaded_file)
-            st.success(f"Loaded: {uploaded_file.name}")
+    uploaded_files = st.file_uploader("Upload PDF or TXT files", type=["pdf", "txt"], accept_multiple_files=True)
+
+    # New uploads are only spooled and queued here; extraction runs on the store's workers
+    for uploaded_file in uploaded_files:
+        key = st.session_state.upload_keys.get(uploaded_file.file_id)
+        # A document the store has evicted is added again from the upload Streamlit still holds
+        if key is None or get_document_store().status(key)[0] == "evicted":
+            st.session_state.upload_keys[uploaded_file.file_id] = get_document_store().add(uploaded_file)
+    library = DocumentLibrary(
+        get_document_store(),
+        [(f.name, st.session_state.upload_keys[f.file_id]) for f in uploaded_files],
+    )
+
+    ingest_pending = bool(library.pending())
+
+    @st.fragment(run_every=1 if ingest_pending else None)
+    def document_status():
+        # Only this fragment polls while documents are ingested, so the chat stays usable
+        for name, key in library.documents:
+            status, detail = library.store.status(key)
+            size = library.store.size(key) if status == "ready" else None
+            if size is not None:
+                # detail is only set when the text was cut short
+                detail = " · ".join(filter(None, [f"{size / 1024:,.0f} KB of text", detail]))
+            st.caption(f"{STATUS_ICONS[status]} **{name}** · {detail or status}")
+        if ingest_pending and not library.pending():
+            # Everything landed; one full rerun stops the polling
+            st.rerun()
+
+    if library:
+        document_status()
 
     st.subheader("📊 Session Stats")
-    msg_count = len([m for m in st.session_state.messages if m["role"] != "system"])
+    # Everything after the system prompt at index 0
+    msg_count = len(st.session_state.messages) - 1
     st.write(f"Messages this session: **{msg_count}**")
+    cache_stats = engine.response_cache.stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · {cache_stats['entries']} stored")
+    if "last_context_usage" in st.session_state:
+        usage = st.session_state.last_context_usage
+        st.caption("Last request tokens: " + " · ".join(f"{name} {count}" for name, count in usage.items()))
+    if st.toggle("Show pipeline metrics", value=False):
+        st.dataframe(
+            [
+                {"stage": stage, "model": model, "n": n, "avg ms": round(mean * 1000, 1),
+                 "p95 ms": round(p95 * 1000, 1), "last ms": round(last * 1000, 1)}
+                for stage, model, n, mean, p95, last in metrics.stage_summary()
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+        for provider in engine.dispatcher.limiters:
+            in_flight = metrics.gauges.get(("provider_in_flight", provider), 0)
+            queued = metrics.gauges.get(("provider_queue_depth", provider), 0)
+            st.caption(f"{provider}: {in_flight} in flight · {queued} queued")
     
     st.subheader("📥 Export Data")
-    chat_text = "\n".join([f"{m['role'].upper()}: {m['content']}" 
-                          for m in st.session_state.messages if m['role'] != 'system'])
-    
+    # Built only when the button is clicked, on Streamlit's download thread
+    export_messages = st.session_state.messages
     st.download_button(
         label="Download Conversation (.txt)",
-        data=chat_text,
+        data=lambda: "".join(iter_transcript(export_messages)),
         file_name="zfluffy_chat_history.txt",
         mime="text/plain",
         use_container_width=True
@@ -107,27 +182,31 @@ with st.sidebar:
 
 if "feedback" not in st.session_state:
     st.session_state.feedback = {}
+    st.session_state.session_id = uuid.uuid4().hex
+
+@st.cache_resource
+def get_feedback_store():
+    # One background writer per process; sessions only enqueue
+    return FeedbackStore(os.getenv("FEEDBACK_DB_PATH", "bot_feedback.sqlite3"))
+
+def log_feedback(message_index, prompt, response, rating):
+    """Queues chat feedback for the background writer; repeated clicks on the same rating are dropped."""
+    if st.session_state.feedback.get(message_index) == rating:
+        return
+    st.session_state.feedback[message_index] = rating
+    get_feedback_store().record(
+        st.session_state.session_id, message_index, model_choice, prompt, response, rating
+    )
 
-def log_feedback_to_csv(message_index, prompt, response, rating):
-    """Saves chat feedback to a local CSV file for review."""
-    file_exists = os.path.isfile('bot_feedback.csv')
-    
-    with open('bot_feedback.csv', mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        # Write header if file is new
-        if not file_exists:
-            writer.writerow(['Timestamp', 'Model', 'User_Prompt', 'Assistant_Response', 'Rating'])
-        
-        writer.writerow([
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            st.session_state.get('model_choice', 'Unknown'),
-            prompt,
-            response,
-            rating
-        ])
-
-# Display chat history
-for i, message in enumerate(st.session_state.messages):
+# Display chat history, newest HISTORY_WINDOW messages only, so reruns cost the same however long the chat gets
+first_visible = max(1, len(st.session_state.messages) - st.session_state.history_window)
+if first_visible > 1:
+    if st.button(f"⬆️ Load earlier messages ({first_visible - 1} hidden)", key="load_earlier"):
+        st.session_state.history_window += HISTORY_WINDOW
+        st.rerun()
+
+for i in range(first_visible, len(st.session_state.messages)):
+    message = st.session_state.messages[i]
     if message["role"] != "system":
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
@@ -137,7 +216,7 @@ for i, message in enumerate(st.session_state.messages):
             if message["role"] == "user" and i == len(st.session_state.messages) - 2:
                 if st.button("✏️ Edit", key=f"edit_{i}"):
                     # Remove this user message and the following assistant message
-                    st.session_state.messages = st.session_state.messages[:i]
+                    engine.truncate_history(st.session_state, i)
                     st.rerun()
 
             if message ["role"] == "assistant":
@@ -145,18 +224,14 @@ for i, message in enumerate(st.session_state.messages):
 
                 with col1:
                     if st.button("👍", key=f"up_{i}"):
-                        st.session_state.feedback[i] = "Positive"
-                        # Log to CSV
                         user_p = st.session_state.messages[i-1]["content"] if i > 0 else "N/A"
-                        log_feedback_to_csv(i, user_p, message["content"], "Positive")
-                        st.toast("Feedback saved to CSV!", icon="💖")
+                        log_feedback(i, user_p, message["content"], "Positive")
+                        st.toast("Feedback saved!", icon="💖")
                 
                 with col2:
                     if st.button("👎", key=f"down_{i}"):
-                        st.session_state.feedback[i] = "Negative"
-                        # Log to CSV
                         user_p = st.session_state.messages[i-1]["content"] if i > 0 else "N/A"
-                        log_feedback_to_csv(i, user_p, message["content"], "Negative")
+                        log_feedback(i, user_p, message["content"], "Negative")
                         st.toast("Feedback logged for review.", icon="🔧")
                 
                 # Show saved feedback status if it exists
@@ -165,140 +240,59 @@ for i, message in enumerate(st.session_state.messages):
                     st.caption(f"Rated: {status}")
 
 # These pills give users quick access to your rule-based logic
-if "chat_summary" not in st.session_state:
-    st.session_state.chat_summary = ""
-
-def compress_memory(history, model_choice):
-    """Generates a 2-sentence summary of the conversation if it gets too long."""
-    # Only compress if history is long (e.g., more than 15 messages)
-    if len(history) < 15:
-        return st.session_state.chat_summary
-    
-    summary_instruction = f"Summarize the key points of this conversation so far in 2 sentences. Previous summary: {st.session_state.chat_summary}"
-    
-    try:
-        if model_choice == "Open AI (GPT-4o)":
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=history + [{"role": "system", "content": summary_instruction}],
-                max_tokens=100
-            )
-            return response.choices[0].message.content
-        else:
-            response = gemini_client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=f"History: {history}. {summary_instruction}"
-            )
-            return response.text
-    except:
-        return st.session_state.chat_summary
-
-# --- 1. FUNCTION TO GENERATE DYNAMIC SUGGESTIONS ---
-def get_dynamic_suggestions(history, model_choice):
-    """Generates 3 short follow-up buttons based on context."""
-    if len(history) <= 1:
-        return ["Shipping Info", "Office Location", "Support"]
-    
-    suggestion_instruction = "Provide 3 very short (1-3 words) follow-up questions. Format: Item 1, Item 2, Item 3"
-    
-    try:
-        if model_choice == "Open AI (GPT-4o)":
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=history + [{"role": "system", "content": suggestion_instruction}],
-                max_tokens=50
-            )
-            raw = response.choices[0].message.content
-        else:
-            response = gemini_client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=f"History: {history}. {suggestion_instruction}"
-            )
-            raw = response.text
-        return [s.strip() for s in raw.split(",")]
-    except:
-        return ["Shipping Info", "Office Location", "Support"]
-
 # --- 2. DISPLAY DYNAMIC SUGGESTIONS ---
 st.write("✨ **Suggested next steps:**")
-current_suggestions = get_dynamic_suggestions(st.session_state.messages, model_choice)
 
-cols = st.columns(len(current_suggestions))
-suggestion_prompt = None
+suggestions_ready = engine.request_suggestions(st.session_state.messages, model_choice) is not None
 
-for i, suggestion in enumerate(current_suggestions):
-    with cols[i]:
-        if st.button(suggestion, key=f"suggest_{i}_{len(st.session_state.messages)}", use_container_width=True):
-            suggestion_prompt = suggestion
+@st.fragment(run_every=None if suggestions_ready else 1)
+def suggestion_pills():
+    # Static defaults show until the background result lands; only this fragment polls for it
+    current_suggestions = engine.request_suggestions(st.session_state.messages, model_choice)
+    if current_suggestions is None:
+        current_suggestions = DEFAULT_SUGGESTIONS
+    elif not suggestions_ready:
+        # The result just arrived; one full rerun swaps the pills in and stops the polling
+        st.rerun()
+
+    cols = st.columns(len(current_suggestions))
+    for i, suggestion in enumerate(current_suggestions):
+        with cols[i]:
+            if st.button(suggestion, key=f"suggest_{i}_{len(st.session_state.messages)}", use_container_width=True):
+                st.session_state.suggestion_prompt = suggestion
+                st.rerun()
+
+suggestion_pills()
+suggestion_prompt = st.session_state.pop("suggestion_prompt", None)
+
+# The page is rendered; load the chosen provider's SDK while the user types
+engine.warm_up(model_choice)
 
 # --- 3. UPDATED CHAT INPUT LOGIC ---
 if prompt := (st.chat_input("Ask me anything...") or suggestion_prompt):
-    st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
         with st.spinner("Zfluffy is thinking..."):
-            rule_response = get_rule_based_response(prompt)
-
-            # 1. Handle Memory Compression
-            if len(st.session_state.messages) > 15:
-                st.session_state.chat_summary = compress_memory(st.session_state.messages, model_choice)
-
-            # 2. Build ONE Consolidated System Prompt (The "Master Instruction")
-            doc_info = f"\n\n[DOCUMENT CONTEXT]:\n{doc_context[:5000]}" if doc_context else ""
-            summary_info = f"\n\n[CONVERSATION SUMMARY]: {st.session_state.chat_summary}" if st.session_state.chat_summary else ""
-            
-            master_system_prompt = (
-                f"{SYSTEM_PROMPT} "
-                f"Your current tone is: {personality}. "
-                f"{summary_info}"
-                f"{doc_info}"
+            # Rule match, memory compression, context packing and cache lookup
+            turn = engine.prepare_turn(
+                st.session_state, prompt, personality, model_choice,
+                documents=library if library else None,
             )
-        
-            if rule_response:
-                full_response = f"📌 [Rule Match]: {rule_response}"
-                st.markdown(full_response)
-            else:
-                try:
-                    # Context Window Management
-                    # We create a temporary message list just for this API call
-                    recent_history = st.session_state.messages[-10:]
-                    # Replace the old system prompt with our new Master Prompt
-                    context_messages = [{"role": "system", "content": master_system_prompt}] + \
-                                       [m for m in recent_history if m["role"] != "system"]
-
-                    if model_choice == "Open AI (GPT-4o)":
-                        stream = openai_client.chat.completions.create(
-                            model="gpt-3.5-turbo",
-                            messages=context_messages, # Now contains Summary + PDF + Personality
-                            stream=True,
-                        )
-                        full_response = st.write_stream(stream)
-                    
-                    else:
-                        # Gemini Streaming
-                        gemini_history = []
-                        for m in context_messages[:-1]:
-                            if m["role"] != "system":
-                                role = "user" if m["role"] == "user" else "model"
-                                gemini_history.append({"role": role, "parts": [m["content"]]})
-                        
-                        response = gemini_client.models.generate_content(
-                            model="gemini-1.5-flash",
-                            contents=prompt,
-                            config={"system_instruction": master_system_prompt}, # Fixed
-                            stream=True
-                        )
-                        full_response = st.write_stream(chunk.text for chunk in response)
-
-                except Exception as e:
-                    # ... (keep your existing error handling)
-                    if "insufficient_quota" in str(e).lower():
-                        full_response = "🚫 **System Note:** OpenAI credits are empty. Switch to Gemini!"
-                    else:
-                        full_response = f"Error: {e}"
-                    st.error(full_response)
-
-    st.session_state.messages.append({"role": "assistant", "content": full_response})
-    st.rerun()
\ No newline at end of file
+
+        if turn.rule_response:
+            full_response = f"📌 [Rule Match]: {turn.rule_response}"
+            st.markdown(full_response)
+            engine.complete_turn(st.session_state, turn, full_response)
+        else:
+            st.session_state.last_context_usage = turn.context_plan.usage
+            try:
+                full_response = st.write_stream(engine.stream_turn(turn, fastest=fastest_mode))
+                engine.complete_turn(st.session_state, turn, full_response)
+            except Exception as e:
+                full_response = engine.error_message(e)
+                st.error(full_response)
+                engine.complete_turn(st.session_state, turn, full_response, failed=True)
+
+    st.rerun()
@@ -0,0 +1,171 @@
+# context_builder.py
+from functools import lru_cache
+
+# Input-token budgets per model. Kept well under the context windows so prompts stay cheap and fast.
+TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 6000,
+    "gemini-1.5-flash": 12000,
+}
+DEFAULT_BUDGET = 4000
+
+# Chat formats add a few tokens of framing per message
+MESSAGE_OVERHEAD = 4
+
+# Share of what is left after the system prompt that document chunks may use
+DOCUMENT_SHARE = 0.4
+
+SECTIONS = ("system", "summary", "documents", "history")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """Local tokenizer for model, or None if the encoding files can't be loaded.
+
+    Gemini has no local tokenizer, so its counts use the OpenAI encoding as a close estimate.
+    tiktoken is only imported here, so rule-only turns never load it.
+    """
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text, model):
+    encoding = get_encoding(model)
+    if encoding is None:
+        # Offline fallback: about four characters per token for English text
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model):
+    """Cuts text down to max_tokens, keeping the beginning."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        # The longest text count_tokens' estimate keeps within max_tokens
+        return text[:max_tokens * 4 - 1]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    # A cut through a merge can re-encode to more tokens, so step back until it fits
+    for keep in range(max_tokens, 0, -1):
+        cut = encoding.decode(tokens[:keep])
+        if len(encoding.encode(cut, disallowed_special=())) <= max_tokens:
+            return cut
+    return ""
+
+
+class ContextPlan:
+    """Result of packing a request: the messages to send and where the tokens went."""
+
+    def __init__(self, system_prompt, history, usage, budget, dropped_turns, dropped_chunks):
+        self.system_prompt = system_prompt
+        self.history = history
+        self.usage = usage
+        self.budget = budget
+        self.dropped_turns = dropped_turns
+        self.dropped_chunks = dropped_chunks
+
+    @property
+    def total_tokens(self):
+        return sum(self.usage.values())
+
+    @property
+    def messages(self):
+        """OpenAI style message list with the packed system prompt first."""
+        if not self.system_prompt:
+            return list(self.history)
+        return [{"role": "system", "content": self.system_prompt}] + self.history
+
+    def gemini_contents(self):
+        """The packed history in google-genai's contents format."""
+        return [
+            {"role": "user" if m["role"] == "user" else "model", "parts": [{"text": m["content"]}]}
+            for m in self.history
+        ]
+
+    def history_text(self):
+        return "\n".join(f"{m['role'].upper()}: {m['content']}" for m in self.history)
+
+
+def build_context(model, system_prompt, history, summary="", doc_chunks=(), budget=None):
+    """Packs a request into the model's token budget in priority order.
+
+    The system prompt always goes in, then the newest turn (trimmed if it alone is
+    too long), the running summary, document chunks in ranked order up to
+    DOCUMENT_SHARE of the remaining budget, and finally as many older turns as fit,
+    newest first.
+    """
+    budget = budget or TOKEN_BUDGETS.get(model, DEFAULT_BUDGET)
+    usage = dict.fromkeys(SECTIONS, 0)
+    turns = [m for m in history if m["role"] != "system"]
+
+    usage["system"] = count_tokens(system_prompt, model) + MESSAGE_OVERHEAD if system_prompt else 0
+    remaining = budget - usage["system"]
+
+    # The newest turn is what we're answering, so it always goes in
+    packed = []
+    if turns:
+        latest = turns[-1]
+        latest_tokens = count_tokens(latest["content"], model) + MESSAGE_OVERHEAD
+        if latest_tokens > remaining:
+            content = truncate_to_tokens(latest["content"], remaining - MESSAGE_OVERHEAD, model)
+            latest = {"role": latest["role"], "content": content}
+            latest_tokens = count_tokens(content, model) + MESSAGE_OVERHEAD
+        packed.append(latest)
+        usage["history"] = latest_tokens
+        remaining -= latest_tokens
+
+    summary_section = ""
+    if summary:
+        candidate = f"\n\n[CONVERSATION SUMMARY]: {summary}"
+        tokens = count_tokens(candidate, model)
+        if tokens <= remaining:
+            summary_section = candidate
+            usage["summary"] = tokens
+            remaining -= tokens
+
+    doc_parts = []
+    dropped_chunks = 0
+    doc_budget = int(remaining * DOCUMENT_SHARE)
+    for chunk in doc_chunks:
+        tokens = count_tokens(chunk, model) + 2
+        if tokens > doc_budget - usage["documents"]:
+            dropped_chunks += 1
+            continue
+        doc_parts.append(chunk)
+        usage["documents"] += tokens
+    remaining -= usage["documents"]
+    doc_section = "\n\n[DOCUMENT CONTEXT]:\n" + "\n...\n".join(doc_parts) if doc_parts else ""
+
+    # Fill the rest with older turns, newest first, stopping at the first that doesn't fit
+    older = turns[:-1]
+    kept = 0
+    for message in reversed(older):
+        tokens = count_tokens(message["content"], model) + MESSAGE_OVERHEAD
+        if tokens > remaining:
+            break
+        packed.append(message)
+        usage["history"] += tokens
+        remaining -= tokens
+        kept += 1
+    packed.reverse()
+
+    return ContextPlan(
+        system_prompt=f"{system_prompt}{summary_section}{doc_section}",
+        history=packed,
+        usage=usage,
+        budget=budget,
+        dropped_turns=len(older) - kept,
+        dropped_chunks=dropped_chunks,
+    )
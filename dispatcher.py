@@ -0,0 +1,518 @@
+# dispatcher.py
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# provider -> (max requests in flight, sustained requests per second (0 for no limit), burst)
+DEFAULT_LIMITS = {
+    "openai": (64, 50.0, 100),
+    # Gemini's free tier allows 15 requests a minute
+    "gemini": (4, 0.25, 15),
+}
+
+# Share of each provider's slots and burst kept free of background calls
+# (suggestions, summaries), so the streamed answer never queues behind them
+INTERACTIVE_SHARE = 0.25
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Longest Retry-After worth waiting out. Gemini's free tier often asks for 30-60 s;
+# failing right away surfaces the error (or lets a hedge fail over) instead.
+MAX_RETRY_AFTER = 10.0
+
+
+def request_key(provider, *parts):
+    """Hash identifying one exact request, so identical ones in flight can share a response."""
+    payload = json.dumps([provider, *parts], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_retryable(error):
+    """Rate limits and overloaded servers are worth another try; an exhausted quota is not."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status in RETRY_STATUSES and "insufficient_quota" not in str(error).lower()
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class ProviderLimiter:
+    """In-flight cap plus token bucket for one provider.
+
+    Shared by threads and event loops: slots go to waiters in FIFO order, and an
+    async waiter is woken on its own loop. Interactive requests (the answer the
+    user is waiting for) are served before background ones, and background
+    requests may never use the last INTERACTIVE_SHARE of slots or burst tokens.
+    A rate of 0 turns the token bucket off.
+    """
+
+    def __init__(self, name, max_concurrency, rate, burst, metrics):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.active = 0
+        self.active_background = 0
+        self.waiters = deque()
+        self.background_waiters = deque()
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        reserved = math.ceil(max_concurrency * INTERACTIVE_SHARE)
+        self.background_slots = max(1, max_concurrency - reserved)
+        self.background_token_floor = min(burst * INTERACTIVE_SHARE, max(0, burst - 1))
+
+    def _enter(self, wake, background):
+        with self.lock:
+            (self.background_waiters if background else self.waiters).append(wake)
+            wakes = self._grant()
+            self._report()
+        granted = wake in wakes
+        if granted:
+            wakes.remove(wake)
+        for other in wakes:
+            other()
+        return granted
+
+    def _grant(self):
+        """Hands free slots to waiters, interactive ones first. Called with the lock held."""
+        wakes = []
+        while self.active < self.max_concurrency:
+            if self.waiters:
+                wakes.append(self.waiters.popleft())
+            elif self.background_waiters and self.active_background < self.background_slots:
+                wakes.append(self.background_waiters.popleft())
+                self.active_background += 1
+            else:
+                break
+            self.active += 1
+        return wakes
+
+    def release(self, background=False):
+        with self.lock:
+            self.active -= 1
+            if background:
+                self.active_background -= 1
+            wakes = self._grant()
+            self._report()
+        for wake in wakes:
+            wake()
+
+    def _report(self):
+        self.metrics.set_gauge("provider_queue_depth", len(self.waiters) + len(self.background_waiters), self.name)
+        self.metrics.set_gauge("provider_in_flight", self.active, self.name)
+
+    def _reserve_token(self, background):
+        """Seconds to wait for this request's token, 0.0 once it is taken.
+
+        An interactive request always takes its token, and the bucket may go
+        negative, which queues later callers behind it. A background request only
+        takes one while the bucket stays above the interactive reserve, and
+        otherwise should wait and ask again.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if background:
+                if self.tokens - 1 < self.background_token_floor:
+                    return (self.background_token_floor + 1 - self.tokens) / self.rate
+                self.tokens -= 1
+                return 0.0
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self, background=False):
+        start = time.perf_counter()
+        granted = threading.Event()
+        if not self._enter(granted.set, background):
+            granted.wait()
+        while True:
+            delay = self._reserve_token(background)
+            if not delay:
+                break
+            time.sleep(delay)
+            if not background:
+                break
+        self.metrics.observe("queue_wait", time.perf_counter() - start, self.name)
+
+    async def aacquire(self, background=False):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            # A waiter cancelled while queued hands its slot on
+            if granted.cancelled():
+                self.release(background)
+            else:
+                granted.set_result(None)
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(grant)
+            except RuntimeError:
+                self.release(background)
+
+        if not self._enter(wake, background):
+            try:
+                await granted
+            except asyncio.CancelledError:
+                # Cancelled after grant() handed over the slot but before this task resumed
+                if granted.done() and not granted.cancelled():
+                    self.release(background)
+                raise
+        try:
+            while True:
+                delay = self._reserve_token(background)
+                if not delay:
+                    break
+                await asyncio.sleep(delay)
+                if not background:
+                    break
+        except BaseException:
+            self.release(background)
+            raise
+        self.metrics.observe("queue_wait", time.perf_counter() - start, self.name)
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class SharedStream:
+    """Chunks of one upstream stream, replayed from the start to every reader that joins.
+
+    The upstream is produced independently of any reader; once every reader has
+    left, it is abandoned and on_abandon (if set) cancels it.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+        self.abandoned = False
+        self.on_abandon = None
+        self.task = None  # the asyncio producer, if any
+        self.cond = threading.Condition()
+        self.async_waiters = []  # (loop, future) pairs woken on every change
+
+    def join(self):
+        with self.cond:
+            if self.abandoned:
+                return False
+            self.readers += 1
+            return True
+
+    def leave(self):
+        with self.cond:
+            self.readers -= 1
+            if self.readers or self.done:
+                return
+            self.abandoned = True
+            on_abandon = self.on_abandon
+        if on_abandon:
+            on_abandon()
+
+    def publish(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self._notify()
+
+    def _notify(self):
+        self.cond.notify_all()
+        for loop, waiter in self.async_waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # the reader's loop is already closed
+        self.async_waiters.clear()
+
+    def read(self):
+        return SharedStreamReader(self)
+
+    async def aread(self):
+        loop = asyncio.get_running_loop()
+        index = 0
+        try:
+            while True:
+                waiter = None
+                with self.cond:
+                    if index < len(self.chunks):
+                        pending = self.chunks[index:]
+                        index = len(self.chunks)
+                    elif self.done:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                    else:
+                        waiter = loop.create_future()
+                        self.async_waiters.append((loop, waiter))
+                if waiter is not None:
+                    await waiter
+                    continue
+                for chunk in pending:
+                    yield chunk
+        finally:
+            self.leave()
+
+
+class SharedStreamReader:
+    """One thread's iterator over a SharedStream.
+
+    abort() may be called from any thread, even while another one is blocked
+    waiting for the next chunk: the reader wakes, ends and leaves the stream.
+    """
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.index = 0
+        self.left = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        shared = self.shared
+        with shared.cond:
+            while not self.left and self.index == len(shared.chunks) and not shared.done:
+                shared.cond.wait()
+            if not self.left and self.index < len(shared.chunks):
+                self.index += 1
+                return shared.chunks[self.index - 1]
+            error = None if self.left else shared.error
+        self.close()
+        if error is not None:
+            raise error
+        raise StopIteration
+
+    def close(self):
+        with self.shared.cond:
+            if self.left:
+                return
+            self.left = True
+            self.shared.cond.notify_all()
+        self.shared.leave()
+
+    abort = close
+
+    def __del__(self):
+        self.close()
+
+
+class Dispatcher:
+    """The one gate every provider request in the process goes through.
+
+    Identical requests already in flight are joined instead of sent again
+    (single-flight). Each provider has a cap on requests in flight and a token
+    bucket, and 429s or 5xx errors are retried with exponential backoff (or after
+    the provider's Retry-After, unless that is over max_retry_after), as long
+    as no text has been streamed yet. Streams are interactive; one-shot calls can
+    be marked background so they never hold up a streamed answer. Queue depth, queue wait, retries and
+    coalesced requests go to the metrics registry.
+    """
+
+    def __init__(self, metrics, limits=None, max_retries=3, backoff=0.5, max_retry_after=MAX_RETRY_AFTER):
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.limiters = {name: ProviderLimiter(name, *limit, metrics) for name, limit in limits.items()}
+        self.flights = {}  # request key -> Future or SharedStream
+        self.lock = threading.Lock()
+
+    def _join(self, key, new_flight):
+        """(flight, is_leader) for key: an identical request in flight, or new_flight registered in its place."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None and (not isinstance(flight, SharedStream) or flight.join()):
+                return flight, False
+            if isinstance(new_flight, SharedStream):
+                new_flight.join()
+            self.flights[key] = new_flight
+            return new_flight, True
+
+    def _forget(self, key, flight):
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def _retry_delay(self, provider, attempt, error):
+        """Seconds to wait before retrying, or None when error shouldn't be retried.
+
+        A provider asking to wait longer than max_retry_after isn't retried.
+        """
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = retry_after(error)
+        if delay is not None and delay > self.max_retry_after:
+            return None
+        self.metrics.increment("provider_retry", provider)
+        return delay or self.backoff * 2 ** attempt * random.uniform(0.8, 1.2)
+
+    # --- One-shot calls ---
+
+    def call(self, provider, key, fn, background=False):
+        """fn() under the provider's limits, shared with identical calls in flight.
+
+        Background calls yield to interactive streams for slots and tokens.
+        """
+        flight, leader = self._join(key, Future())
+        if not leader:
+            self.metrics.increment("coalesced", provider)
+            return flight.result()
+
+        limiter = self.limiters[provider]
+        try:
+            attempt = 0
+            while True:
+                limiter.acquire(background)
+                try:
+                    result = fn()
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(provider, attempt, e)
+                    if delay is None:
+                        raise
+                finally:
+                    limiter.release(background)
+                time.sleep(delay)
+                attempt += 1
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            self._forget(key, flight)
+
+    # --- Streams ---
+
+    def stream(self, provider, key, open_stream):
+        """Text chunks of open_stream() under the provider's limits, shared with identical streams in flight.
+
+        Returns a SharedStreamReader. Aborting it (from any thread) when no other
+        reader is left aborts the upstream too, if open_stream() returned a
+        providers.TextStream, which frees its connection and slot right away.
+        """
+        shared, leader = self._join(key, SharedStream())
+        if leader:
+            thread = threading.Thread(
+                target=self._produce, args=(provider, key, open_stream, shared),
+                daemon=True, name=f"dispatch-{provider}",
+            )
+            thread.start()
+        else:
+            self.metrics.increment("coalesced", provider)
+        return shared.read()
+
+    def _produce(self, provider, key, open_stream, shared):
+        limiter = self.limiters[provider]
+        try:
+            attempt = 0
+            while True:
+                limiter.acquire()
+                produced = False
+                stream = None
+                try:
+                    stream = iter(open_stream())
+                    with shared.cond:
+                        shared.on_abandon = getattr(stream, "abort", None)
+                        abandoned = shared.abandoned
+                    if not abandoned:
+                        for chunk in stream:
+                            produced = True
+                            shared.publish(chunk)
+                            if shared.abandoned:
+                                break
+                    shared.finish()
+                    return
+                except Exception as e:
+                    delay = None if produced or shared.abandoned else self._retry_delay(provider, attempt, e)
+                    if delay is None:
+                        shared.finish(e)
+                        return
+                finally:
+                    if stream is not None and hasattr(stream, "close"):
+                        stream.close()
+                    limiter.release()
+                if shared.abandoned:
+                    shared.finish()
+                    return
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            self._forget(key, shared)
+
+    async def astream(self, provider, key, open_stream):
+        """asyncio version of stream(); open_stream() returns an async iterator."""
+        shared, leader = self._join(key, SharedStream())
+        if leader:
+            loop = asyncio.get_running_loop()
+            task = loop.create_task(self._aproduce(provider, key, open_stream, shared))
+            shared.on_abandon = lambda: loop.call_soon_threadsafe(task.cancel)
+            # Held here so the task isn't garbage collected while it runs
+            shared.task = task
+        else:
+            self.metrics.increment("coalesced", provider)
+
+        reader = shared.aread()
+        try:
+            async for chunk in reader:
+                yield chunk
+        finally:
+            await reader.aclose()
+
+    async def _aproduce(self, provider, key, open_stream, shared):
+        limiter = self.limiters[provider]
+        try:
+            attempt = 0
+            while True:
+                await limiter.aacquire()
+                produced = False
+                stream = None
+                try:
+                    stream = open_stream()
+                    async for chunk in stream:
+                        produced = True
+                        shared.publish(chunk)
+                    shared.finish()
+                    return
+                except Exception as e:
+                    delay = None if produced else self._retry_delay(provider, attempt, e)
+                    if delay is None:
+                        shared.finish(e)
+                        return
+                finally:
+                    if stream is not None:
+                        await stream.aclose()
+                    limiter.release()
+                await asyncio.sleep(delay)
+                attempt += 1
+        except asyncio.CancelledError:
+            shared.finish()
+        finally:
+            self._forget(key, shared)
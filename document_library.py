@@ -0,0 +1,294 @@
+# document_library.py
+import atexit
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from extraction import iter_document_text, spool_upload
+
+# Upper bound on text kept per document (about 28k chunks of 150 words); extraction
+# stops streaming pages past it and the document's status says it was truncated
+MAX_DOCUMENT_CHARS = 20_000_000
+
+FILE_KINDS = {"application/pdf": "pdf", "text/plain": "txt"}
+
+
+def map_text(path):
+    """Read-only memory map of a text file; an empty file maps to b""."""
+    with open(path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class DocumentStore:
+    """Process-wide, content-addressed store of extracted document text.
+
+    Uploads are ingested on a thread pool (big PDFs also fan out to the
+    extraction process pool) and written to disk as UTF-8 files named by content
+    hash, so a file uploaded by any number of sessions is extracted once. Text is
+    read back through mmap, and only an LRU of BM25 indexes, at most max_index_bytes
+    of postings, stays in memory. An index that dropped out of it is rebuilt in the
+    background the next time it is asked for.
+
+    The store is an LRU too: past max_documents or max_bytes of text, the least
+    recently used finished documents are evicted with their files. Sessions
+    still holding an evicted key see the status "evicted" and add the file again.
+    """
+
+    def __init__(self, root=None, workers=4, max_index_bytes=256 * 1024 * 1024, max_documents=1000,
+                 max_bytes=1024 * 1024 * 1024, max_chars=MAX_DOCUMENT_CHARS, metrics=None):
+        self.temporary = root is None
+        if root is None:
+            root = tempfile.mkdtemp(prefix="botty-documents-")
+            atexit.register(shutil.rmtree, root, True)
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_index_bytes = max_index_bytes
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self.lock = threading.Lock()
+        # key -> (status, detail), least recently used first; status is queued,
+        # extracting, indexing, ready or failed
+        self.states = OrderedDict()
+        self.jobs = {}  # key -> Future of an ingestion or index rebuild still running
+        self.sizes = {}  # key -> bytes of text on disk, for ready documents
+        self.total_bytes = 0
+        self.indexes = OrderedDict()  # key -> DocumentIndex over the mapped text
+        self.index_bytes = 0
+
+        # Text left by an earlier process sharing this root counts against the limits
+        names = [name for name in os.listdir(root) if name.endswith(".txt")]
+        for name in sorted(names, key=lambda name: os.path.getmtime(os.path.join(root, name))):
+            self._ready(name[:-len(".txt")])
+        self._evict()
+
+    def text_path(self, key):
+        return os.path.join(self.root, f"{key}.txt")
+
+    def add(self, uploaded_file):
+        """Spools an upload to disk and queues it for ingestion. Returns its content key.
+
+        Files of a type the store can't read get a key whose status is failed.
+        """
+        kind = FILE_KINDS.get(uploaded_file.type)
+        if kind is None:
+            key = f"unsupported-{uploaded_file.type}"
+            self._set(key, "failed", f"unsupported file type ({uploaded_file.type or 'unknown'})")
+            return key
+        path, digest = spool_upload(uploaded_file, f".{kind}")
+        key = f"{kind}-{digest}"
+        with self.lock:
+            known = key in self.states
+            if known:
+                self.states.move_to_end(key)
+            else:
+                self.states[key] = ("queued", "")
+                self.jobs[key] = self.executor.submit(self._ingest, key, path, uploaded_file.type)
+        if known:
+            os.remove(path)
+        return key
+
+    def _set(self, key, status, detail=""):
+        with self.lock:
+            self.states[key] = (status, detail)
+
+    def _ready(self, key, detail=""):
+        """Marks key ready and counts its text against the limits."""
+        size = os.path.getsize(self.text_path(key))
+        with self.lock:
+            self.states[key] = ("ready", detail)
+            self.total_bytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+
+    def _ingest(self, key, path, file_type):
+        start = time.perf_counter()
+        partial = self.text_path(key) + ".part"
+        try:
+            if os.path.exists(self.text_path(key)):
+                # Extracted by another process sharing this root
+                self._ready(key)
+                return
+            self._set(key, "extracting")
+            pieces = iter_document_text(path, file_type, max_chars=self.max_chars)
+            with open(partial, "w", encoding="utf-8") as handle:
+                while True:
+                    try:
+                        handle.write(next(pieces))
+                    except StopIteration as done:
+                        truncated = done.value
+                        break
+            os.replace(partial, self.text_path(key))
+            self._set(key, "indexing")
+            self.index(key)
+            self._ready(key, f"truncated to the first {self.max_chars:,} characters" if truncated else "")
+        except Exception as e:
+            self._set(key, "failed", str(e))
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            os.remove(path)
+            with self.lock:
+                self.jobs.pop(key, None)
+            self._evict()
+            if self.metrics is not None:
+                self.metrics.observe("document_ingest", time.perf_counter() - start)
+
+    def _evict(self):
+        """Drops the least recently used finished documents until the store is within its limits."""
+        evicted = []
+        with self.lock:
+            # The newest document stays, even when it alone is over max_bytes
+            newest = next(reversed(self.states), None)
+            for key in list(self.states):
+                if len(self.states) <= self.max_documents and self.total_bytes <= self.max_bytes:
+                    break
+                if key in self.jobs or key == newest:
+                    continue
+                del self.states[key]
+                self.total_bytes -= self.sizes.pop(key, 0)
+                self._drop_index(key)
+                evicted.append(key)
+        for key in evicted:
+            try:
+                os.remove(self.text_path(key))
+            except OSError:
+                pass  # already gone, or still mapped on a platform that forbids removing it
+
+    def close(self):
+        """Stops the ingestion workers, dropping queued jobs. A temporary root is removed."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.temporary:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def status(self, key):
+        """(status, detail) for a key returned by add()."""
+        with self.lock:
+            return self.states.get(key, ("evicted", ""))
+
+    def size(self, key):
+        """Bytes of extracted text on disk, or None unless the document is ready."""
+        with self.lock:
+            return self.sizes.get(key)
+
+    def wait(self, key, timeout=None):
+        """Blocks until the document's ingestion has finished."""
+        with self.lock:
+            job = self.jobs.get(key)
+        if job is not None:
+            job.result(timeout)
+
+    def _cached(self, key):
+        # Caller holds self.lock
+        if key in self.states:
+            self.states.move_to_end(key)
+        index = self.indexes.get(key)
+        if index is not None:
+            self.indexes.move_to_end(key)
+        return index
+
+    def _drop_index(self, key):
+        # Caller holds self.lock
+        index = self.indexes.pop(key, None)
+        if index is not None:
+            self.index_bytes -= index.nbytes
+
+    def index(self, key):
+        """BM25 index over the document's mapped text, built here and now if it isn't cached."""
+        with self.lock:
+            index = self._cached(key)
+        if index is not None:
+            return index
+
+        # numpy is only loaded once a session actually has a document
+        from retrieval import DocumentIndex
+
+        index = DocumentIndex(map_text(self.text_path(key)))
+        with self.lock:
+            self._drop_index(key)
+            self.indexes[key] = index
+            self.index_bytes += index.nbytes
+            # The newest index stays, even when it alone is over max_index_bytes
+            while self.index_bytes > self.max_index_bytes and len(self.indexes) > 1:
+                self._drop_index(next(iter(self.indexes)))
+        return index
+
+    def cached_index(self, key):
+        """The document's BM25 index if it is in memory, else None.
+
+        A missing index (dropped from the LRU, or a document left by an earlier
+        process) is rebuilt on the ingestion pool, once however many callers ask.
+        """
+        with self.lock:
+            index = self._cached(key)
+            if index is None and key in self.states and key not in self.jobs:
+                self.jobs[key] = self.executor.submit(self._rebuild_index, key)
+        return index
+
+    def _rebuild_index(self, key):
+        try:
+            self.index(key)
+        except Exception as e:
+            self._set(key, "failed", str(e))
+        finally:
+            with self.lock:
+                self.jobs.pop(key, None)
+
+
+class DocumentLibrary:
+    """One session's documents: (name, key) pairs over the shared DocumentStore.
+
+    Documents still being ingested, or whose index is being rebuilt, are skipped,
+    so chatting never waits on them.
+    """
+
+    def __init__(self, store, documents):
+        self.store = store
+        self.documents = list(documents)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def ready(self):
+        return [(name, key) for name, key in self.documents if self.store.status(key)[0] == "ready"]
+
+    def pending(self):
+        return [
+            (name, key) for name, key in self.documents
+            if self.store.status(key)[0] in ("queued", "extracting", "indexing")
+        ]
+
+    def top_chunks(self, query, k=10):
+        """The k best chunks for query across every ready document, labelled with their file name.
+
+        Each document contributes at most k candidates, so memory stays bounded by
+        k times the number of documents, not by their size.
+        """
+        ready = []
+        for name, key in self.ready():
+            index = self.store.cached_index(key)
+            if index is not None:
+                ready.append((name, index))
+        scored = [
+            (score, name, index, chunk_id)
+            for name, index in ready
+            for score, chunk_id in index.scored_search(query, k)
+        ]
+        if not scored:
+            # Nothing matched: the opening chunks, spread across the documents
+            per_document = max(1, k // len(ready)) if ready else 0
+            return [
+                f"[{name}] {index.chunk(i)}"
+                for name, index in ready
+                for i in range(min(per_document, len(index)))
+            ][:k]
+        scored.sort(key=lambda item: -item[0])
+        return [f"[{name}] {index.chunk(chunk_id)}" for _, name, index, chunk_id in scored[:k]]
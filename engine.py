@@ -0,0 +1,568 @@
+# engine.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from context_builder import build_context, count_tokens
+from data_config import BOT_RULES, SYSTEM_PROMPT
+from dispatcher import DEFAULT_LIMITS, Dispatcher, request_key
+from hedging import HedgedStream, hedged_astream
+from metrics import MetricsRegistry
+from providers import (
+    gemini_text_astream, gemini_text_stream, openai_text_astream, openai_text_stream, track_response,
+)
+from response_cache import MemoryBackend, ResponseCache, SQLiteBackend, cache_key, context_hash, replay
+from rule_engine import RuleEngine
+from suggestions import SuggestionCache
+
+OPENAI_CHOICE = "Open AI (GPT-4o)"
+GEMINI_CHOICE = "Google Gemini (Free Tier)"
+
+MODEL_NAMES = {
+    OPENAI_CHOICE: "gpt-3.5-turbo",
+    GEMINI_CHOICE: "gemini-1.5-flash",
+}
+
+SUMMARY_TRIGGER = 15  # start summarizing once history passes this many messages
+RECENT_WINDOW = 10  # most recent messages kept out of the rolling summary
+SUMMARY_BUDGET = 3000  # input tokens for one summary update
+SUGGESTION_BUDGET = 2000  # input tokens for one suggestion request
+SUGGESTION_WINDOW = 20  # most recent messages suggestions are generated (and cached) from
+
+DEFAULT_SUGGESTIONS = ["Shipping Info", "Office Location", "Support"]
+
+
+class ChatSession:
+    """Conversation state for one user.
+
+    The engine only reads and writes these attributes, so Streamlit's
+    st.session_state can be passed in its place.
+    """
+
+    def __init__(self):
+        self.messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        self.chat_summary = ""
+        # Messages before summarized_upto are already folded into chat_summary (index 0 is the system prompt)
+        self.summarized_upto = 1
+        self.summary_job = None
+
+
+def init_session(state):
+    """Fills in any engine attributes a session object doesn't have yet."""
+    for name, value in vars(ChatSession()).items():
+        if name not in state:
+            setattr(state, name, value)
+
+
+class TurnPlan:
+    """Everything decided about a turn before the model is called."""
+
+    def __init__(self, prompt, model_choice, trace, rule_response=None, context_plan=None,
+                 response_key=None, cached_response=None):
+        self.prompt = prompt
+        self.model_choice = model_choice
+        self.trace = trace
+        self.rule_response = rule_response
+        self.context_plan = context_plan
+        self.response_key = response_key
+        self.cached_response = cached_response
+        # The model that actually answered; in fastest mode it can be the other one
+        self.provider = model_choice
+
+    def answered_by(self, provider):
+        """Records a hedge's winner; the rest of the turn's timings go under its model."""
+        self.provider = provider
+        self.trace.model = MODEL_NAMES[provider]
+
+    @property
+    def source(self):
+        if self.rule_response is not None:
+            return "rule"
+        if self.cached_response is not None:
+            return "cache"
+        return "model"
+
+
+class ChatEngine:
+    """The chat pipeline without any UI: rule match, rolling summary, context
+    packing, response cache and provider streaming, with sync and asyncio entry points.
+
+    One engine is shared by every session in a process. Per-user state lives in a
+    ChatSession (or st.session_state) passed to each call.
+    """
+
+    def __init__(self, openai_key=None, google_key=None, metrics=None, response_cache=None,
+                 hedge_delay=1.5, max_connections=100, provider_limits=None):
+        self.openai_key = openai_key
+        self.google_key = google_key
+        self.hedge_delay = hedge_delay
+        self.metrics = metrics or MetricsRegistry()
+        self.response_cache = response_cache or ResponseCache(MemoryBackend())
+        # Every provider request goes through here: single-flight, rate limits and 429 retries
+        self.dispatcher = Dispatcher(self.metrics, provider_limits)
+        self.rules = RuleEngine(BOT_RULES)
+        self.suggestions = SuggestionCache(self.get_dynamic_suggestions)
+        self.summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+        self.max_connections = max_connections
+        # SDK clients are imported and built on first use, so a session that only hits
+        # BOT_RULES never loads openai or google.genai
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+        self.warmed = set()  # providers warm_up() has already started on
+        # Not clients_lock, which is held while a client is built
+        self.warmed_lock = threading.Lock()
+
+    def _client(self, name, build):
+        client = self.clients.get(name)
+        if client is None:
+            with self.clients_lock:
+                client = self.clients.get(name)
+                if client is None:
+                    client = self.clients[name] = build()
+        return client
+
+    def _pool_options(self):
+        import httpx
+
+        return {
+            "limits": httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            "timeout": httpx.Timeout(60.0, connect=10.0),
+        }
+
+    @property
+    def openai_client(self):
+        if not self.openai_key:
+            return None
+
+        def build():
+            import httpx
+            from openai import OpenAI
+
+            # Retries are the dispatcher's job, so the SDK's own are turned off. The response
+            # hook lets an abandoned stream shut its connection down from another thread.
+            return OpenAI(
+                api_key=self.openai_key, max_retries=0,
+                http_client=httpx.Client(event_hooks={"response": [track_response]}, **self._pool_options()),
+            )
+
+        return self._client("openai", build)
+
+    @property
+    def async_openai_client(self):
+        if not self.openai_key:
+            return None
+
+        def build():
+            import httpx
+            from openai import AsyncOpenAI
+
+            # One pooled connection set for every concurrent async session
+            return AsyncOpenAI(
+                api_key=self.openai_key, max_retries=0, http_client=httpx.AsyncClient(**self._pool_options())
+            )
+
+        return self._client("async_openai", build)
+
+    @property
+    def gemini_client(self):
+        if not self.google_key:
+            return None
+
+        def build():
+            import httpx
+            from google import genai
+
+            http_client = httpx.Client(event_hooks={"response": [track_response]}, **self._pool_options())
+            return genai.Client(api_key=self.google_key, http_options={"httpx_client": http_client})
+
+        return self._client("gemini", build)
+
+    def warm_up(self, model_choice):
+        """Builds the chosen provider's client in the background, so its first turn doesn't pay for the import.
+
+        Each provider is warmed once, on its own thread, and only when it has a key.
+        """
+        name, key = ("openai", self.openai_key) if model_choice == OPENAI_CHOICE else ("gemini", self.google_key)
+        if not key:
+            return
+        with self.warmed_lock:
+            if name in self.warmed:
+                return
+            self.warmed.add(name)
+        threading.Thread(target=getattr, args=(self, f"{name}_client"), daemon=True, name=f"warm-{name}").start()
+
+    @classmethod
+    def from_env(cls):
+        """Engine configured from the same environment variables as bot.py."""
+        metrics = MetricsRegistry(trace_path=os.getenv("METRICS_TRACE_PATH"))
+        if os.getenv("METRICS_PORT"):
+            metrics.serve(int(os.getenv("METRICS_PORT")))
+        # RESPONSE_CACHE_BACKEND=sqlite shares answers across sessions and restarts through a local file
+        if os.getenv("RESPONSE_CACHE_BACKEND", "memory") == "sqlite":
+            backend = SQLiteBackend(os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite3"))
+        else:
+            backend = MemoryBackend()
+        # OPENAI_MAX_CONCURRENCY, OPENAI_RATE_LIMIT (requests/s), OPENAI_RATE_BURST, and the same for GEMINI_
+        limits = {
+            provider: (
+                int(os.getenv(f"{provider.upper()}_MAX_CONCURRENCY", concurrency)),
+                float(os.getenv(f"{provider.upper()}_RATE_LIMIT", rate)),
+                int(os.getenv(f"{provider.upper()}_RATE_BURST", burst)),
+            )
+            for provider, (concurrency, rate, burst) in DEFAULT_LIMITS.items()
+        }
+        return cls(
+            openai_key=os.getenv("OPENAI_API_KEY"),
+            google_key=os.getenv("GOOGLE_API_KEY"),
+            metrics=metrics,
+            response_cache=ResponseCache(backend, ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400"))),
+            hedge_delay=float(os.getenv("HEDGE_DELAY", "1.5")),
+            provider_limits=limits,
+        )
+
+    def close(self):
+        """Stops the background summary and suggestion workers, dropping queued jobs."""
+        self.suggestions.close()
+        self.summary_executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Provider calls, all through the dispatcher ---
+
+    def openai_completion(self, messages, max_tokens):
+        """Text of a one-shot gpt-3.5-turbo completion, queued as background work."""
+        response = self.dispatcher.call(
+            "openai",
+            request_key("openai", "gpt-3.5-turbo", messages, max_tokens),
+            lambda: self.openai_client.chat.completions.create(
+                model="gpt-3.5-turbo", messages=messages, max_tokens=max_tokens
+            ),
+            background=True,
+        )
+        return response.choices[0].message.content
+
+    def gemini_completion(self, contents):
+        """Text of a one-shot gemini-1.5-flash response, queued as background work."""
+        response = self.dispatcher.call(
+            "gemini",
+            request_key("gemini", "gemini-1.5-flash", contents),
+            lambda: self.gemini_client.models.generate_content(model="gemini-1.5-flash", contents=contents),
+            background=True,
+        )
+        return response.text
+
+    def openai_stream(self, messages):
+        return self.dispatcher.stream(
+            "openai", request_key("openai", "gpt-3.5-turbo", messages),
+            lambda: openai_text_stream(self.openai_client, "gpt-3.5-turbo", messages),
+        )
+
+    def gemini_stream(self, contents, system_instruction):
+        return self.dispatcher.stream(
+            "gemini", request_key("gemini", "gemini-1.5-flash", contents, system_instruction),
+            lambda: gemini_text_stream(self.gemini_client, "gemini-1.5-flash", contents, system_instruction),
+        )
+
+    def openai_astream(self, messages):
+        return self.dispatcher.astream(
+            "openai", request_key("openai", "gpt-3.5-turbo", messages),
+            lambda: openai_text_astream(self.async_openai_client, "gpt-3.5-turbo", messages),
+        )
+
+    def gemini_astream(self, contents, system_instruction):
+        return self.dispatcher.astream(
+            "gemini", request_key("gemini", "gemini-1.5-flash", contents, system_instruction),
+            lambda: gemini_text_astream(self.gemini_client, "gemini-1.5-flash", contents, system_instruction),
+        )
+
+    # --- Rules, memory and suggestions ---
+
+    def get_rule_based_response(self, user_input):
+        return self.rules.match(user_input)
+
+    def compress_memory(self, new_messages, previous_summary, model_choice):
+        """Folds messages that left the recent window into the running 2-sentence summary.
+
+        Returns None if the provider call failed.
+        """
+        summary_instruction = f"Update the running summary with the messages above, in 2 sentences. Previous summary: {previous_summary}"
+        plan = build_context(MODEL_NAMES[model_choice], "", new_messages, budget=SUMMARY_BUDGET)
+
+        try:
+            with self.metrics.timer("summary", MODEL_NAMES[model_choice]):
+                if model_choice == OPENAI_CHOICE:
+                    return self.openai_completion(
+                        plan.messages + [{"role": "system", "content": summary_instruction}], max_tokens=100
+                    )
+                else:
+                    return self.gemini_completion(f"History: {plan.history_text()}. {summary_instruction}")
+        except Exception:
+            return None
+
+    def update_rolling_summary(self, session, model_choice):
+        """Applies a finished summary job, then starts one for messages that fell out of the window.
+
+        Each job only sees the newly dropped messages plus the previous summary, and runs
+        in the background, so the user's turn never waits on it.
+        """
+        history = session.messages
+        if session.summarized_upto > len(history):
+            # History was cut below what the summary covers (without truncate_history): rebuild it
+            self._reset_summary(session)
+
+        job = session.summary_job
+        if job is not None:
+            upto, future = job
+            if not future.done():
+                return
+            session.summary_job = None
+            summary = future.result()
+            # A failed job leaves its messages unsummarized, so the next call tries them again
+            if summary is not None and upto <= len(history):
+                session.chat_summary = summary
+                session.summarized_upto = upto
+
+        if len(history) <= SUMMARY_TRIGGER:
+            return
+        upto = len(history) - RECENT_WINDOW
+        if upto <= session.summarized_upto:
+            return
+
+        new_messages = [m for m in history[session.summarized_upto:upto] if m["role"] != "system"]
+        future = self.summary_executor.submit(
+            self.compress_memory, new_messages, session.chat_summary, model_choice
+        )
+        session.summary_job = (upto, future)
+
+    def _reset_summary(self, session):
+        session.chat_summary = ""
+        session.summarized_upto = 1
+        session.summary_job = None
+
+    def truncate_history(self, session, length):
+        """Drops every message from index length on (Edit, Regenerate), keeping the rolling summary consistent.
+
+        A summary that covers dropped messages is rebuilt from scratch, and a job
+        summarizing any of them is discarded.
+        """
+        session.messages = session.messages[:length]
+        job = session.summary_job
+        if session.summarized_upto > length:
+            self._reset_summary(session)
+        elif job is not None and job[0] > length:
+            session.summary_job = None
+
+    def get_dynamic_suggestions(self, history, model_choice):
+        """Generates 3 short follow-up buttons based on context."""
+        if len(history) <= 1:
+            return DEFAULT_SUGGESTIONS
+
+        suggestion_instruction = "Provide 3 very short (1-3 words) follow-up questions. Format: Item 1, Item 2, Item 3"
+        plan = build_context(MODEL_NAMES[model_choice], "", history, budget=SUGGESTION_BUDGET)
+
+        try:
+            with self.metrics.timer("suggestions", MODEL_NAMES[model_choice]):
+                if model_choice == OPENAI_CHOICE:
+                    raw = self.openai_completion(
+                        plan.messages + [{"role": "system", "content": suggestion_instruction}], max_tokens=50
+                    )
+                else:
+                    raw = self.gemini_completion(f"History: {plan.history_text()}. {suggestion_instruction}")
+                return [s.strip() for s in raw.split(",")]
+        except Exception:
+            return DEFAULT_SUGGESTIONS
+
+    def request_suggestions(self, history, model_choice):
+        """Cached suggestions for this history, or None while they are generated in the background."""
+        if len(history) <= 1:
+            return DEFAULT_SUGGESTIONS
+        # Only the tail is hashed and sent, so the per-rerun cost doesn't grow with the chat
+        return self.suggestions.request(history[-SUGGESTION_WINDOW:], model_choice)
+
+    # --- Turns ---
+
+    def prepare_turn(self, session, prompt, personality, model_choice, documents=None):
+        """Records the user's message and decides how to answer it: rule, cache or model.
+
+        If deciding fails (the response cache or a document index raised), the
+        message is taken back before the error propagates.
+        """
+        session.messages.append({"role": "user", "content": prompt})
+        trace = self.metrics.turn(MODEL_NAMES[model_choice])
+        try:
+            return self._plan_turn(session, prompt, personality, model_choice, documents, trace)
+        except BaseException:
+            self.abandon_turn(session, TurnPlan(prompt, model_choice, trace))
+            raise
+
+    def _plan_turn(self, session, prompt, personality, model_choice, documents, trace):
+        with trace.stage("rule_match"):
+            rule_response = self.get_rule_based_response(prompt)
+        if rule_response:
+            trace.event("rule_match")
+            return TurnPlan(prompt, model_choice, trace, rule_response=rule_response)
+
+        # Incremental, in the background
+        with trace.stage("summary_update"):
+            self.update_rolling_summary(session, model_choice)
+
+        # Packed into the model's token budget: summary, relevant document chunks, then as many of
+        # the turns the summary doesn't cover yet as fit
+        with trace.stage("context_build"):
+            context_plan = build_context(
+                MODEL_NAMES[model_choice],
+                f"{SYSTEM_PROMPT} Your current tone is: {personality}. ",
+                session.messages[session.summarized_upto:],
+                summary=session.chat_summary,
+                doc_chunks=documents.top_chunks(prompt, k=10) if documents is not None else [],
+            )
+        trace.add_tokens("prompt", context_plan.total_tokens)
+
+        # Same prompt, personality, model and context as an earlier answer: replay it
+        response_key = cache_key(
+            prompt, personality, MODEL_NAMES[model_choice],
+            context_hash(context_plan.system_prompt, context_plan.history[:-1]),
+        )
+        with trace.stage("cache_lookup"):
+            cached_response = self.response_cache.get(response_key)
+        if cached_response is not None:
+            trace.event("cache_hit")
+
+        return TurnPlan(prompt, model_choice, trace, context_plan=context_plan,
+                        response_key=response_key, cached_response=cached_response)
+
+    def _providers(self, plan, fastest, make_openai, make_gemini):
+        """(name, open_stream) pairs to try, the chosen model first."""
+        available = []
+        if self.openai_key:
+            available.append((OPENAI_CHOICE, make_openai))
+        if self.google_key:
+            available.append((GEMINI_CHOICE, make_gemini))
+        chosen = [p for p in available if p[0] == plan.model_choice]
+        if not chosen:
+            raise RuntimeError(f"{plan.model_choice} is not configured. Please check your .env file.")
+        if not fastest:
+            return chosen
+        return chosen + [p for p in available if p[0] != plan.model_choice]
+
+    def stream_turn(self, plan, fastest=False):
+        """Text chunks of the answer for a prepared turn, for synchronous callers."""
+        if plan.rule_response is not None:
+            return iter([f"📌 [Rule Match]: {plan.rule_response}"])
+        if plan.cached_response is not None:
+            return plan.trace.stream(replay(plan.cached_response), replay=True)
+
+        context_plan = plan.context_plan
+        providers = self._providers(
+            plan, fastest,
+            lambda: self.openai_stream(context_plan.messages),
+            lambda: self.gemini_stream(context_plan.gemini_contents(), context_plan.system_prompt),
+        )
+        if len(providers) > 1:
+            return plan.trace.stream(self._hedged_stream(plan, providers))
+        return plan.trace.stream(providers[0][1]())
+
+    def _hedged_stream(self, plan, providers):
+        hedged = HedgedStream(providers, hedge_delay=self.hedge_delay)
+        chunks = iter(hedged)
+        try:
+            # HedgedStream knows its winner once the first chunk is out
+            for chunk in chunks:
+                if hedged.provider != plan.provider:
+                    plan.answered_by(hedged.provider)
+                yield chunk
+        finally:
+            chunks.close()
+
+    async def astream_turn(self, plan, fastest=False):
+        """Async text chunks of the answer for a prepared turn, over the pooled async clients."""
+        if plan.rule_response is not None:
+            yield f"📌 [Rule Match]: {plan.rule_response}"
+            return
+        if plan.cached_response is not None:
+            for chunk in plan.trace.stream(replay(plan.cached_response), replay=True):
+                yield chunk
+            return
+
+        context_plan = plan.context_plan
+        providers = self._providers(
+            plan, fastest,
+            lambda: self.openai_astream(context_plan.messages),
+            lambda: self.gemini_astream(context_plan.gemini_contents(), context_plan.system_prompt),
+        )
+        if len(providers) > 1:
+            stream = hedged_astream(providers, hedge_delay=self.hedge_delay, on_decided=plan.answered_by)
+        else:
+            stream = providers[0][1]()
+
+        trace = plan.trace
+        start = time.perf_counter()
+        first = True
+        try:
+            async for chunk in stream:
+                if first:
+                    trace.record("first_token", time.perf_counter() - start)
+                    first = False
+                yield chunk
+        finally:
+            trace.record("stream", time.perf_counter() - start)
+
+    def error_message(self, error):
+        if "insufficient_quota" in str(error).lower():
+            return "🚫 **System Note:** OpenAI credits are empty. Switch to Gemini!"
+        return f"Error: {error}"
+
+    def complete_turn(self, session, plan, full_response, failed=False, prefetch_suggestions=True):
+        """Stores the answer, caches it and starts the background summary.
+
+        With prefetch_suggestions, the follow-up suggestions are started too, for
+        UIs that show them after every answer.
+        """
+        if failed:
+            plan.trace.event("error")
+        elif plan.source == "model" and isinstance(full_response, str) and full_response:
+            # The key is for the chosen model, so a hedge won by the other one isn't cached
+            if plan.provider == plan.model_choice:
+                self.response_cache.put(plan.response_key, full_response)
+            plan.trace.add_tokens("completion", count_tokens(full_response, MODEL_NAMES[plan.provider]))
+
+        session.messages.append({"role": "assistant", "content": full_response})
+        self.update_rolling_summary(session, plan.model_choice)
+        if prefetch_suggestions:
+            # Start on the follow-up suggestions now, so they are ready (or close) by the next render
+            self.request_suggestions(session.messages, plan.model_choice)
+        plan.trace.finish()
+
+    def abandon_turn(self, session, plan):
+        """Takes back the user's message of a turn that was never answered."""
+        last = session.messages[-1]
+        if last["role"] == "user" and last["content"] == plan.prompt:
+            session.messages.pop()
+        plan.trace.event("abandoned")
+        plan.trace.finish()
+
+    async def achat(self, session, prompt, personality="Witty & Spicy", model_choice=OPENAI_CHOICE, fastest=False):
+        """One full turn as an async stream of text chunks; the session is updated when it ends.
+
+        If the stream is closed or cancelled before the answer is complete (the
+        client went away), the turn is rolled back, and so is a turn whose
+        preparation raised, which propagates. Provider errors become the answer.
+        Suggestions aren't prefetched; request_suggestions() generates them when a
+        client asks.
+        """
+        # Takes its own message back if it raises
+        plan = self.prepare_turn(session, prompt, personality, model_choice)
+        parts = []
+        try:
+            async for chunk in self.astream_turn(plan, fastest=fastest):
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            message = self.error_message(e)
+            self.complete_turn(session, plan, message, failed=True, prefetch_suggestions=False)
+            yield message
+            return
+        except BaseException:
+            self.abandon_turn(session, plan)
+            raise
+        self.complete_turn(session, plan, "".join(parts), prefetch_suggestions=False)
@@ -0,0 +1,161 @@
+# extraction.py
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import types
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+SPOOL_CHUNK = 1024 * 1024
+PAGES_PER_TASK = 8
+# Below this page count a process pool costs more than it saves
+PARALLEL_MIN_PAGES = 32
+
+POOL_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Lazily created, process-wide pool shared by every extraction."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, because forking a threaded Streamlit server is unsafe
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            # Streamlit runs the app script as __main__, and spawn re-runs __main__ in
+            # every worker. Workers only need this module, so they are all started
+            # now with an empty __main__ in place of the script.
+            script = sys.modules["__main__"]
+            sys.modules["__main__"] = types.ModuleType("__main__")
+            try:
+                for _ in range(POOL_WORKERS):
+                    _pool.submit(os.getpid)
+            finally:
+                sys.modules["__main__"] = script
+    return _pool
+
+
+def discard_process_pool(pool):
+    """Drops a pool whose worker died, so the next get_process_pool() starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def spool_upload(uploaded_file, suffix=""):
+    """Copies an upload to a temp file in fixed-size chunks, hashing it on the way.
+
+    Returns (path, sha256 hex). The caller owns the file and should remove it.
+    """
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    handle = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    with handle:
+        while True:
+            block = uploaded_file.read(SPOOL_CHUNK)
+            if not block:
+                break
+            digest.update(block)
+            handle.write(block)
+    uploaded_file.seek(0)
+    return handle.name, digest.hexdigest()
+
+
+def extract_page_range(path, start, stop):
+    """Worker entry point: text of pages [start, stop) of the PDF at path."""
+    import fitz
+
+    with fitz.open(path) as doc:
+        return [doc[number].get_text() for number in range(start, min(stop, doc.page_count))]
+
+
+def iter_pdf_pages(path, parallel=True, pages_per_task=PAGES_PER_TASK):
+    """Yields the text of each page in order.
+
+    Large documents are split into page ranges that run on the process pool. At
+    most two ranges per worker are in flight, so memory stays bounded and closing
+    the generator early cancels the work that has not started yet. If a worker
+    dies, the pool is replaced and the unfinished ranges run once more.
+    PyMuPDF is imported on the first PDF, not when the app starts.
+    """
+    import fitz
+
+    with fitz.open(path) as doc:
+        page_count = doc.page_count
+        if not parallel or page_count < PARALLEL_MIN_PAGES:
+            for page in doc:
+                yield page.get_text()
+            return
+
+    pool = get_process_pool()
+    ranges = deque(range(0, page_count, pages_per_task))
+    pending = deque()
+    retried = False
+    try:
+        while ranges or pending:
+            try:
+                while ranges and len(pending) < POOL_WORKERS * 2:
+                    start = ranges[0]
+                    pending.append((start, pool.submit(extract_page_range, path, start, start + pages_per_task)))
+                    ranges.popleft()
+                pages = pending[0][1].result()
+            except BrokenProcessPool:
+                # A worker died (a crash in PyMuPDF, the OOM killer), which breaks the
+                # whole pool. A document that also breaks the fresh pool fails.
+                discard_process_pool(pool)
+                if retried:
+                    raise
+                retried = True
+                ranges.extendleft(reversed([start for start, _ in pending]))
+                pending.clear()
+                pool = get_process_pool()
+                continue
+            pending.popleft()
+            yield from pages
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def iter_text_blocks(path, block_chars=64 * 1024):
+    with io.open(path, "r", encoding="utf-8", errors="replace") as handle:
+        while True:
+            block = handle.read(block_chars)
+            if not block:
+                break
+            yield block
+
+
+def iter_document_text(path, file_type, max_chars=None, parallel=True):
+    """Streams a spooled document's text piece by piece, stopping once max_chars is reached.
+
+    The generator returns True if it cut text off at max_chars, and False if the
+    whole document fit (even when it is exactly max_chars long).
+    """
+    if file_type == "application/pdf":
+        pieces = iter_pdf_pages(path, parallel=parallel)
+    elif file_type == "text/plain":
+        pieces = iter_text_blocks(path)
+    else:
+        return False
+
+    collected = 0
+    try:
+        for piece in pieces:
+            if max_chars is not None and collected + len(piece) > max_chars:
+                yield piece[:max_chars - collected]
+                return True
+            collected += len(piece)
+            yield piece
+        return False
+    finally:
+        pieces.close()
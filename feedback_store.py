@@ -0,0 +1,176 @@
+# feedback_store.py
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    session_id TEXT NOT NULL,
+    message_index INTEGER NOT NULL,
+    created REAL NOT NULL,
+    model TEXT NOT NULL,
+    rating TEXT NOT NULL,
+    prompt BLOB,
+    response BLOB,
+    PRIMARY KEY (session_id, message_index)
+);
+CREATE INDEX IF NOT EXISTS feedback_model_rating ON feedback (model, rating);
+"""
+
+WRITE_ATTEMPTS = 3  # tries per batch before its events are dropped
+EXIT_FLUSH_TIMEOUT = 5.0  # seconds shutdown waits for queued feedback
+
+logger = logging.getLogger(__name__)
+
+
+def pack_text(text):
+    return zlib.compress(text.encode("utf-8"))
+
+
+def unpack_text(blob):
+    return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+
+class FeedbackStore:
+    """Thumbs-up/down events, queued in memory and written to SQLite in batches.
+
+    record() never touches the disk; a single background writer drains the queue
+    in one transaction per batch, so concurrent sessions never contend on the file.
+    A repeated click on the same message of the same session replaces the earlier
+    rating instead of adding a row. Prompt and response text are stored compressed.
+    """
+
+    def __init__(self, path="bot_feedback.sqlite3", batch_size=200, flush_interval=1.0, retry_delay=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue()
+        self.written = 0
+        self.dropped = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self.writer = threading.Thread(target=self._run, daemon=True, name="feedback-writer")
+        self.writer.start()
+        atexit.register(self.flush, EXIT_FLUSH_TIMEOUT)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, session_id, message_index, model, prompt, response, rating):
+        self.queue.put((session_id, message_index, time.time(), model, rating, prompt, response))
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = [self.queue.get()]
+            # Gather whatever else arrives shortly after, up to one batch
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                conn = self._write_with_retries(conn, batch)
+            except Exception:
+                self.dropped += len(batch)
+                logger.exception("Dropped %d feedback events", len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_with_retries(self, conn, batch):
+        """Writes a batch, reconnecting and backing off between failed attempts. Returns the connection to use next."""
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                self._write(conn, batch)
+                return conn
+            except sqlite3.Error as e:
+                if attempt == WRITE_ATTEMPTS:
+                    # Feedback is best effort; a locked or broken file must not kill the writer
+                    self.dropped += len(batch)
+                    logger.error("Dropped %d feedback events after %d failed writes: %s", len(batch), attempt, e)
+                    return conn
+                logger.warning("Feedback write failed (attempt %d of %d), retrying: %s", attempt, WRITE_ATTEMPTS, e)
+            time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                conn.close()
+                conn = self._connect()
+            except sqlite3.Error as e:
+                logger.warning("Could not reopen the feedback database: %s", e)
+        return conn
+
+    def _write(self, conn, batch):
+        # Last click wins when a batch holds several ratings for the same message
+        latest = {}
+        for event in batch:
+            latest[(event[0], event[1])] = event
+        rows = [
+            (session_id, index, created, model, rating, pack_text(prompt), pack_text(response))
+            for session_id, index, created, model, rating, prompt, response in latest.values()
+        ]
+        with conn:
+            conn.executemany(
+                "INSERT INTO feedback (session_id, message_index, created, model, rating, prompt, response) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (session_id, message_index) DO UPDATE SET "
+                "created = excluded.created, model = excluded.model, rating = excluded.rating, "
+                "prompt = excluded.prompt, response = excluded.response",
+                rows,
+            )
+        self.written += len(rows)
+
+    def flush(self, timeout=None):
+        """Blocks until every queued event has been written, or dropped after failed writes.
+
+        Gives up after timeout seconds, or at once if the writer thread has died.
+        Returns whether the queue was drained.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not self.writer.is_alive() or (remaining is not None and remaining <= 0):
+                    return False
+                # Woken when the queue drains; the short wait also notices a dead writer
+                self.queue.all_tasks_done.wait(0.1 if remaining is None else min(remaining, 0.1))
+        return True
+
+    def summary(self):
+        """Rating counts per model, served from the (model, rating) index."""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT model, rating, COUNT(*) FROM feedback GROUP BY model, rating ORDER BY model, rating"
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def recent(self, limit=50):
+        """The latest feedback rows with their text unpacked, for review."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT created, model, rating, prompt, response FROM feedback ORDER BY created DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            (created, model, rating, unpack_text(prompt), unpack_text(response))
+            for created, model, rating, prompt, response in rows
+        ]
@@ -0,0 +1,184 @@
+# hedging.py
+import asyncio
+import queue
+import threading
+import time
+
+
+class HedgedStream:
+    """Streams text from whichever provider produces a first token first.
+
+    providers is an ordered list of (name, open_stream) pairs, preferred first.
+    open_stream() starts a request and returns an iterator of text chunks. The
+    preferred provider starts immediately; each next one starts after
+    hedge_delay seconds without a first token, or right away when the current
+    ones have all failed. The first provider to deliver a token wins. Losing
+    streams that have an abort() method (dispatcher streams do) are aborted the
+    moment the winner is known, even while blocked waiting for their first
+    token; any other stream is closed as soon as it shows up.
+    """
+
+    def __init__(self, providers, hedge_delay=1.5):
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.events = queue.Queue()
+        self.decided = threading.Event()
+        self.lock = threading.Lock()
+        self.provider = None  # name of the winner, once known
+        self.first_token_at = None
+        self.errors = {}
+        self.streams = {}  # name -> stream, while it races
+
+    def _race(self, name, open_stream):
+        try:
+            stream = iter(open_stream())
+            with self.lock:
+                lost = self.decided.is_set()
+                self.streams[name] = stream
+            if not lost:
+                for chunk in stream:
+                    if chunk:
+                        break
+                else:
+                    chunk = ""
+        except Exception as e:
+            self.events.put(("error", name, e, None))
+            return
+        with self.lock:
+            lost = self.decided.is_set()
+            if not lost:
+                self.events.put(("first", name, chunk, stream))
+        if lost:
+            # Lost the race: drop the connection instead of reading the whole answer
+            _close(stream)
+
+    def _start(self, index):
+        name, open_stream = self.providers[index]
+        thread = threading.Thread(target=self._race, args=(name, open_stream), daemon=True, name=f"hedge-{name}")
+        thread.start()
+
+    def __iter__(self):
+        started = time.perf_counter()
+        self._start(0)
+        launched, running = 1, 1
+
+        while True:
+            timeout = self.hedge_delay if launched < len(self.providers) else None
+            try:
+                kind, name, payload, stream = self.events.get(timeout=timeout)
+            except queue.Empty:
+                # No first token within the hedge delay: ask the next provider too
+                self._start(launched)
+                launched += 1
+                running += 1
+                continue
+
+            if kind == "error":
+                self.errors[name] = payload
+                running -= 1
+                if running == 0:
+                    if launched == len(self.providers):
+                        raise payload
+                    # Everything in flight failed (e.g. insufficient_quota): fail over now
+                    self._start(launched)
+                    launched += 1
+                    running += 1
+                continue
+
+            with self.lock:
+                self.decided.set()
+                losers = [other for other_name, other in self.streams.items() if other_name != name]
+            for loser in losers:
+                abort = getattr(loser, "abort", None)
+                if abort:
+                    abort()
+            self.provider = name
+            self.first_token_at = time.perf_counter() - started
+            break
+
+        # Streams that beat the decision but lost the race are closed here
+        self._close_stragglers()
+        yield payload
+        yield from stream
+
+    def _close_stragglers(self):
+        while True:
+            try:
+                kind, _, _, stream = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "first":
+                _close(stream)
+
+
+def _close(stream):
+    close = getattr(stream, "close", None)
+    if close:
+        close()
+
+
+async def _first_chunk(open_stream):
+    stream = open_stream()
+    async for chunk in stream:
+        if chunk:
+            return chunk, stream
+    return "", stream
+
+
+async def hedged_astream(providers, hedge_delay=1.5, on_decided=None):
+    """asyncio version of HedgedStream for async text streams.
+
+    Same rules: the preferred provider starts first, the next one after
+    hedge_delay or as soon as everything in flight has failed, and the first to
+    produce a token wins. Losing requests are cancelled. on_decided(name) is
+    called with the winner's name once it is known.
+    """
+    providers = list(providers)
+    tasks = {}
+    launched = 0
+    last_error = None
+
+    def launch():
+        nonlocal launched
+        name, open_stream = providers[launched]
+        tasks[asyncio.ensure_future(_first_chunk(open_stream))] = name
+        launched += 1
+
+    launch()
+    try:
+        while True:
+            timeout = hedge_delay if launched < len(providers) else None
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+
+            winner = None
+            for task in done:
+                name = tasks.pop(task)
+                if task.exception() is not None:
+                    last_error = task.exception()
+                elif winner is None:
+                    winner = (name, task.result())
+                else:
+                    # Finished in the same tick but lost the race
+                    await task.result()[1].aclose()
+            if winner is not None:
+                break
+            if not tasks:
+                if launched == len(providers):
+                    raise last_error
+                launch()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    name, (chunk, stream) = winner
+    if on_decided:
+        on_decided(name)
+    try:
+        yield chunk
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
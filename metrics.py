@@ -0,0 +1,221 @@
+# metrics.py
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.last = value
+
+    def quantile(self, q):
+        """Bucket upper bound below which a q share of observations fall."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound if bound != float("inf") else BUCKETS[-1]
+        return BUCKETS[-1]
+
+
+class MetricsRegistry:
+    """Per-stage latency histograms and token counters for the chat pipeline.
+
+    Recording is a perf_counter delta plus a short critical section, cheap enough
+    to leave on. Finished turns are kept in a small ring buffer and, when
+    trace_path is set, appended to a JSONL file for offline analysis.
+    """
+
+    def __init__(self, trace_path=None, keep_turns=200):
+        self.lock = threading.Lock()
+        self.latency = {}  # (stage, model) -> Histogram
+        self.tokens = {}  # (model, kind) -> count
+        self.counters = {}  # (name, model) -> count
+        self.gauges = {}  # (name, model) -> current value
+        self.turns = deque(maxlen=keep_turns)
+        self.trace_path = trace_path
+        self.trace_file = open(trace_path, "a", encoding="utf-8", buffering=1) if trace_path else None
+
+    def observe(self, stage, seconds, model=""):
+        with self.lock:
+            histogram = self.latency.get((stage, model))
+            if histogram is None:
+                histogram = self.latency[(stage, model)] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, model=""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, model)
+
+    def add_tokens(self, model, kind, count):
+        with self.lock:
+            self.tokens[(model, kind)] = self.tokens.get((model, kind), 0) + count
+
+    def increment(self, name, model="", amount=1):
+        with self.lock:
+            self.counters[(name, model)] = self.counters.get((name, model), 0) + amount
+
+    def set_gauge(self, name, value, model=""):
+        with self.lock:
+            self.gauges[(name, model)] = value
+
+    def turn(self, model):
+        return TurnTrace(self, model)
+
+    def finish_turn(self, trace):
+        record = trace.as_dict()
+        with self.lock:
+            self.turns.append(record)
+            if self.trace_file:
+                self.trace_file.write(json.dumps(record) + "\n")
+
+    def stage_summary(self):
+        """(stage, model, count, mean s, p95 s, last s) rows for display."""
+        with self.lock:
+            return [
+                (stage, model, h.count, h.sum / h.count, h.quantile(0.95), h.last)
+                for (stage, model), h in sorted(self.latency.items())
+                if h.count
+            ]
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP botty_stage_seconds Latency of each chat pipeline stage.",
+            "# TYPE botty_stage_seconds histogram",
+        ]
+        with self.lock:
+            for (stage, model), h in sorted(self.latency.items()):
+                labels = f'stage="{stage}",model="{model}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'botty_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'botty_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"botty_stage_seconds_sum{{{labels}}} {h.sum}")
+                lines.append(f"botty_stage_seconds_count{{{labels}}} {h.count}")
+
+            lines.append("# HELP botty_tokens_total Tokens sent to and received from each model.")
+            lines.append("# TYPE botty_tokens_total counter")
+            for (model, kind), count in sorted(self.tokens.items()):
+                lines.append(f'botty_tokens_total{{model="{model}",kind="{kind}"}} {count}')
+
+            lines.append("# HELP botty_events_total Pipeline events such as rule matches and cache hits.")
+            lines.append("# TYPE botty_events_total counter")
+            for (name, model), count in sorted(self.counters.items()):
+                lines.append(f'botty_events_total{{event="{name}",model="{model}"}} {count}')
+
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f"# TYPE botty_{name} gauge")
+                for (gauge, model), value in sorted(self.gauges.items()):
+                    if gauge == name:
+                        lines.append(f'botty_{name}{{model="{model}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Starts a /metrics endpoint on a daemon thread and returns the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics-exporter").start()
+        return server
+
+
+class TurnTrace:
+    """Stage timings and token counts of one chat turn."""
+
+    def __init__(self, registry, model):
+        self.registry = registry
+        self.model = model
+        self.started = time.time()
+        self.stages = {}
+        self.tokens = {}
+        self.events = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds, 6)
+        self.registry.observe(name, seconds, self.model)
+
+    def add_tokens(self, kind, count):
+        self.tokens[kind] = self.tokens.get(kind, 0) + count
+        self.registry.add_tokens(self.model, kind, count)
+
+    def event(self, name):
+        self.events.append(name)
+        self.registry.increment(name, self.model)
+
+    def stream(self, chunks, replay=False):
+        """Passes a response stream through, recording time to first token and total stream time.
+
+        A replayed answer (from the response cache) is timed as cache_replay
+        instead, so its near-zero latencies don't mask the provider's.
+        """
+        start = time.perf_counter()
+        first = True
+        try:
+            for chunk in chunks:
+                if first and not replay:
+                    self.record("first_token", time.perf_counter() - start)
+                    first = False
+                yield chunk
+        finally:
+            self.record("cache_replay" if replay else "stream", time.perf_counter() - start)
+
+    def finish(self):
+        self.registry.finish_turn(self)
+
+    def as_dict(self):
+        return {
+            "ts": self.started,
+            "model": self.model,
+            "stages": self.stages,
+            "tokens": self.tokens,
+            "events": self.events,
+        }
@@ -0,0 +1,140 @@
+# providers.py
+import socket
+import threading
+
+_reading = threading.local()
+
+
+def track_response(response):
+    """httpx response hook: hands a streamed response to the TextStream reading it on this thread."""
+    stream = getattr(_reading, "stream", None)
+    if stream is not None:
+        stream._attach(response)
+
+
+def shutdown_response(response):
+    """Shuts down a response's connection, waking a thread blocked reading it.
+
+    Closing the response alone leaves that thread in recv() until the provider
+    sends another byte.
+    """
+    network_stream = response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+
+
+class TextStream:
+    """Text chunks of a streamed provider response that can be aborted from any thread.
+
+    chunks is a generator that sends the request on its first step. When the
+    client has track_response as a response hook, abort() shuts the connection
+    down, so a reader blocked in another thread waiting for the next chunk wakes
+    at once and the stream ends quietly. Without the hook, the stream still
+    stops at the next chunk.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.lock = threading.Lock()
+        self.response = None
+        self.aborted = False
+
+    def _attach(self, response):
+        with self.lock:
+            self.response = response
+            aborted = self.aborted
+        if aborted:
+            shutdown_response(response)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.aborted:
+            self.close()
+            raise StopIteration
+        _reading.stream = self
+        try:
+            return next(self.chunks)
+        except Exception:
+            if not self.aborted:
+                raise
+            self.close()
+            raise StopIteration
+        finally:
+            _reading.stream = None
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            response = self.response
+        if response is not None:
+            shutdown_response(response)
+
+    def close(self):
+        """Closes the stream; only from the thread iterating it (use abort() from others)."""
+        self.chunks.close()
+
+
+def _openai_chunks(client, model, messages):
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True)
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
+
+def _gemini_chunks(client, model, contents, system_instruction):
+    response = client.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config={"system_instruction": system_instruction},
+    )
+    try:
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    finally:
+        response.close()
+
+
+def openai_text_stream(client, model, messages):
+    """Text of a streamed OpenAI chat completion, closing the connection when done or abandoned."""
+    return TextStream(_openai_chunks(client, model, messages))
+
+
+def gemini_text_stream(client, model, contents, system_instruction):
+    """Text of a streamed Gemini response."""
+    return TextStream(_gemini_chunks(client, model, contents, system_instruction))
+
+
+async def openai_text_astream(client, model, messages):
+    """Async twin of openai_text_stream for an AsyncOpenAI client."""
+    stream = await client.chat.completions.create(model=model, messages=messages, stream=True)
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+
+
+async def gemini_text_astream(client, model, contents, system_instruction):
+    """Async twin of gemini_text_stream, using the client's .aio interface."""
+    response = await client.aio.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config={"system_instruction": system_instruction},
+    )
+    try:
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    finally:
+        await response.aclose()
@@ -0,0 +1,150 @@
+# response_cache.py
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """Lowercases, collapses whitespace and drops trailing punctuation, so trivial variants share a key."""
+    return WHITESPACE.sub(" ", prompt.lower()).strip().rstrip("?!. ")
+
+
+def context_hash(system_prompt, history):
+    """Hash of everything the model sees besides the newest prompt."""
+    payload = json.dumps([system_prompt] + [[m["role"], m["content"]] for m in history], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_key(prompt, personality, model, context):
+    payload = json.dumps([normalize_prompt(prompt), personality, model, context], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU, visible to every session in this server process."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            response, created = entry
+            if time.time() - created > ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        with self.lock:
+            self.entries[key] = (response, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteBackend:
+    """LRU stored in a local SQLite file, shared by every process that opens the same path."""
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS response_cache_last_used ON response_cache (last_used)")
+
+    def _connect(self):
+        # sqlite3 connections are per thread; Streamlit sessions run on different threads
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key, ttl):
+        conn = self._connect()
+        row = conn.execute("SELECT response, created FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created = row
+        now = time.time()
+        with conn:
+            if now - created > ttl:
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (now, key))
+        return response
+
+    def put(self, key, response):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """TTL'd answer cache in front of the LLM providers, with hit/miss counters."""
+
+    def __init__(self, backend, ttl=24 * 3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        response = self.backend.get(key, self.ttl)
+        with self.lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, key, response):
+        self.backend.put(key, response)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.backend)}
+
+
+def replay(response, words_per_chunk=3, delay=0.0):
+    """Yields a cached answer in small pieces so st.write_stream renders it like a live stream."""
+    pieces = re.split(r"(\s+)", response)
+    for start in range(0, len(pieces), words_per_chunk * 2):
+        yield "".join(pieces[start:start + words_per_chunk * 2])
+        if delay:
+            time.sleep(delay)
@@ -0,0 +1,125 @@
+# retrieval.py
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# One UTF-8 encoded character that str.split() doesn't split on. A bytes \S only
+# knows ASCII whitespace, but PDFs are full of U+00A0 and other Unicode spaces,
+# so the multi-byte ones (U+0085, U+00A0, U+1680, U+2000-U+200A, U+2028,
+# U+2029, U+202F, U+205F, U+3000) are excluded by their encodings.
+WORD_CHAR = (
+    rb"[^\t\n\x0b\x0c\r\x1c-\x1f \x80-\xff]"
+    rb"|\xc2[\x80-\x84\x86-\x9f\xa1-\xbf]"
+    rb"|[\xc3-\xdf][\x80-\xbf]"
+    rb"|\xe1(?!\x9a\x80)[\x80-\xbf]{2}"
+    rb"|\xe2(?!\x80[\x80-\x8a\xa8\xa9\xaf]|\x81\x9f)[\x80-\xbf]{2}"
+    rb"|\xe3(?!\x80\x80)[\x80-\xbf]{2}"
+    rb"|[\xe0\xe4-\xef][\x80-\xbf]{2}"
+    rb"|[\xf0-\xf4][\x80-\xbf]{3}"
+)
+WORD_PATTERN = re.compile(rb"(?:" + WORD_CHAR + rb")+")
+# Rough bytes per posting list besides its arrays: the dict slot, term string, tuple and array headers
+TERM_OVERHEAD = 360
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def chunk_spans(data, chunk_words=150, overlap_words=30):
+    """(start, end) byte offsets of overlapping windows of roughly chunk_words words in UTF-8 data.
+
+    data may be bytes or an mmap; word boundaries are found without decoding it,
+    splitting on the same Unicode whitespace as str.split().
+    """
+    bounds = np.fromiter(
+        (offset for match in WORD_PATTERN.finditer(data) for offset in match.span()), dtype=np.int64
+    ).reshape(-1, 2)
+    words = len(bounds)
+    if not words:
+        return np.empty((0, 2), dtype=np.int64)
+    step = max(chunk_words - overlap_words, 1)
+    starts = np.arange(0, words, step)
+    # Stop after the first window that reaches the last word
+    starts = starts[:int(np.argmax(starts + chunk_words >= words)) + 1]
+    ends = np.minimum(starts + chunk_words, words) - 1
+    return np.stack([bounds[starts, 0], bounds[ends, 1]], axis=1)
+
+
+class DocumentIndex:
+    """BM25 index over the chunks of one document.
+
+    text is a str or UTF-8 bytes-like data such as an mmap of a file. Chunks are
+    kept as byte offsets and decoded only when returned, so the text of a mapped
+    document never sits in the Python heap. All BM25 weights are computed up
+    front, so a query is a handful of NumPy scatter-adds over the postings of its
+    terms plus a partial sort.
+    """
+
+    def __init__(self, text, chunk_words=150, overlap_words=30, k1=1.5, b=0.75):
+        self.source = text.encode("utf-8") if isinstance(text, str) else text
+        self.spans = chunk_spans(self.source, chunk_words, overlap_words)
+        self.postings = {}
+
+        # Gather raw (chunk, term frequency) postings per term, one chunk at a time
+        raw = {}
+        lengths = np.zeros(len(self.spans), dtype=np.float32)
+        for chunk_id in range(len(self.spans)):
+            terms = Counter(tokenize(self.chunk(chunk_id)))
+            lengths[chunk_id] = sum(terms.values())
+            for term, tf in terms.items():
+                entry = raw.get(term)
+                if entry is None:
+                    entry = raw[term] = ([], [])
+                entry[0].append(chunk_id)
+                entry[1].append(tf)
+        avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+        total = len(self.spans)
+        norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else lengths
+        for term, (ids, tfs) in raw.items():
+            ids = np.array(ids, dtype=np.int32)
+            tfs = np.array(tfs, dtype=np.float32)
+            idf = math.log(1 + (total - len(ids) + 0.5) / (len(ids) + 0.5))
+            weights = idf * tfs * (k1 + 1) / (tfs + norm[ids])
+            self.postings[term] = (ids, weights.astype(np.float32))
+        # Approximate memory held by the index, so caches can be bounded by size
+        self.nbytes = self.spans.nbytes + sum(
+            ids.nbytes + weights.nbytes + len(term) + TERM_OVERHEAD for term, (ids, weights) in self.postings.items()
+        )
+
+    def __len__(self):
+        return len(self.spans)
+
+    def chunk(self, chunk_id):
+        """Text of one chunk, with whitespace collapsed."""
+        start, end = self.spans[chunk_id]
+        return " ".join(self.source[start:end].decode("utf-8", errors="replace").split())
+
+    def scored_search(self, query, k=5):
+        """(score, chunk index) pairs of the k best chunks for query, best first."""
+        if not len(self.spans):
+            return []
+        scores = np.zeros(len(self.spans), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(scores[matched], -k)[-k:]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return list(zip(scores[matched].tolist(), matched.tolist()))
+
+    def search(self, query, k=5):
+        """Returns indices of the k best chunks for query, best first."""
+        return [chunk_id for _, chunk_id in self.scored_search(query, k)]
+
+    def top_chunks(self, query, k=5):
+        """Texts of the k best chunks for query, falling back to the opening chunks."""
+        ids = self.search(query, k) or list(range(min(k, len(self.spans))))
+        return [self.chunk(i) for i in ids]
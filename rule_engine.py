@@ -0,0 +1,102 @@
+# rule_engine.py
+import re
+
+# Characters that make a pattern more than a plain "word|word|word" list
+REGEX_META = set(".^$*+?{}[]\\()")
+
+
+def split_literal_pattern(pattern):
+    """Returns the alternatives of a pure literal pattern, or None if it needs the regex engine."""
+    if any(ch in REGEX_META for ch in pattern):
+        return None
+    alternatives = pattern.split("|")
+    # An empty alternative matches everything, leave that to re.search
+    if not all(alternatives):
+        return None
+    return alternatives
+
+
+class RuleEngine:
+    """Precompiled BOT_RULES matcher with the same first-match precedence as a linear re.search scan.
+
+    Literal alternatives are merged into one Aho-Corasick automaton, so a prompt is
+    scanned once no matter how many rules exist. Patterns using real regex syntax
+    are compiled once and only tried when they come before the best literal hit.
+    """
+
+    def __init__(self, rules):
+        self.responses = list(rules.values())
+        self.regex_rules = []  # (rule index, compiled pattern), in rule order
+
+        # Automaton state: goto transitions, failure links and the lowest rule index ending here
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [None]
+
+        for index, pattern in enumerate(rules):
+            alternatives = split_literal_pattern(pattern)
+            if alternatives is None:
+                self.regex_rules.append((index, re.compile(pattern)))
+                continue
+            for word in alternatives:
+                self._add_word(word, index)
+
+        self._build_failure_links()
+
+    def _add_word(self, word, index):
+        state = 0
+        for ch in word:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.best.append(None)
+            state = next_state
+        if self.best[state] is None or index < self.best[state]:
+            self.best[state] = index
+
+    def _build_failure_links(self):
+        # Breadth-first so every failure target is finished before it is used
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                # Inherit the best match reachable through the failure chain
+                inherited = self.best[self.fail[child]]
+                if inherited is not None and (self.best[child] is None or inherited < self.best[child]):
+                    self.best[child] = inherited
+
+    def first_literal_match(self, text):
+        """Returns the lowest rule index whose literal alternatives occur in text, or None."""
+        goto, fail, best = self.goto, self.fail, self.best
+        state = 0
+        found = None
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = best[state]
+            if hit is not None and (found is None or hit < found):
+                found = hit
+                if found == 0:
+                    break
+        return found
+
+    def match(self, user_input):
+        """Returns the response of the first matching rule, or None."""
+        text = user_input.lower()
+        found = self.first_literal_match(text)
+        for index, regex in self.regex_rules:
+            if found is not None and index > found:
+                break
+            if regex.search(text):
+                return self.responses[index]
+        if found is None:
+            return None
+        return self.responses[found]
@@ -0,0 +1,224 @@
+# server.py
+# Headless HTTP/SSE front end for the chat engine, for clients that don't need Streamlit.
+#
+#   python server.py --port 8000
+#   curl -N -X POST localhost:8000/v1/chat -d '{"message": "Tell me about Saturn"}'
+#
+# POST /v1/chat          {"message", "session_id"?, "personality"?, "model": "openai"|"gemini", "fastest"?}
+#                        -> text/event-stream of "token" events, then one "done" event (or one
+#                        "error" event if the turn failed and was rolled back)
+# GET  /v1/suggestions   ?session_id=... -> {"suggestions": [...], "ready": bool}; generated on the
+#                        first request for the current history, so poll until ready
+# GET  /metrics          Prometheus text format
+# GET  /healthz
+import argparse
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+from dotenv import load_dotenv
+
+from engine import DEFAULT_SUGGESTIONS, GEMINI_CHOICE, OPENAI_CHOICE, ChatEngine, ChatSession
+
+MODEL_CHOICES = {"openai": OPENAI_CHOICE, "gemini": GEMINI_CHOICE}
+MAX_BODY = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """In-memory LRU of chat sessions, each with a lock so one user's turns run in order."""
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+
+    def get(self, session_id):
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            entry = self.sessions[session_id] = (ChatSession(), asyncio.Lock())
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(session_id)
+        return entry
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatServer:
+    """Minimal asyncio HTTP/1.1 server streaming engine turns as server-sent events."""
+
+    def __init__(self, engine, host="127.0.0.1", port=8000, max_sessions=10000):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.sessions = SessionStore(max_sessions)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_BODY)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            method, target, body = await self.read_request(reader)
+            url = urlsplit(target)
+            if method == "POST" and url.path == "/v1/chat":
+                await self.chat(body, writer)
+            elif method == "GET" and url.path == "/v1/suggestions":
+                await self.suggestions(parse_qs(url.query), writer)
+            elif method == "GET" and url.path == "/metrics":
+                await self.respond(writer, 200, self.engine.metrics.render_prometheus(), "text/plain; version=0.0.4")
+            elif method == "GET" and url.path == "/healthz":
+                await self.respond_json(writer, 200, {"ok": True})
+            else:
+                raise HTTPError(404, f"No route for {method} {url.path}")
+        except HTTPError as e:
+            await self.respond_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            raise ConnectionResetError
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, body
+
+    async def respond(self, writer, status, text, content_type):
+        data = text.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    async def respond_json(self, writer, status, payload):
+        await self.respond(writer, status, json.dumps(payload), "application/json")
+
+    async def send_event(self, writer, event, payload):
+        writer.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    async def chat(self, body, writer):
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+        message = request.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(400, "'message' is required")
+        model = request.get("model", "openai")
+        model_choice = MODEL_CHOICES.get(model) if isinstance(model, str) else None
+        if model_choice is None:
+            raise HTTPError(400, f"'model' must be one of {sorted(MODEL_CHOICES)}")
+        for field in ("session_id", "personality"):
+            if not isinstance(request.get(field, ""), str):
+                raise HTTPError(400, f"'{field}' must be a string")
+
+        session_id = request.get("session_id") or uuid.uuid4().hex
+        session, lock = self.sessions.get(session_id)
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+        )
+        async with lock:
+            turn = self.engine.achat(
+                session,
+                message,
+                personality=request.get("personality", "Witty & Spicy"),
+                model_choice=model_choice,
+                fastest=bool(request.get("fastest")),
+            )
+            parts = []
+            try:
+                async for chunk in turn:
+                    parts.append(chunk)
+                    await self.send_event(writer, "token", {"text": chunk})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                # The headers are already out, so the failure is reported in the stream
+                logger.exception("Chat turn failed")
+                await self.send_event(writer, "error", {"error": str(e) or type(e).__name__})
+                return
+            finally:
+                # A client that disconnected mid-stream leaves the turn open; closing it rolls it back
+                await turn.aclose()
+            await self.send_event(writer, "done", {"session_id": session_id, "response": "".join(parts)})
+
+    async def suggestions(self, query, writer):
+        session_id = (query.get("session_id") or [""])[0]
+        model_choice = MODEL_CHOICES.get((query.get("model") or ["openai"])[0], OPENAI_CHOICE)
+        if session_id not in self.sessions.sessions:
+            raise HTTPError(404, "Unknown session_id")
+        session, _ = self.sessions.get(session_id)
+        suggestions = self.engine.request_suggestions(session.messages, model_choice)
+        await self.respond_json(
+            writer, 200, {"suggestions": suggestions or DEFAULT_SUGGESTIONS, "ready": suggestions is not None}
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless HTTP/SSE server for the Zfluffy chat engine")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+    server = ChatServer(ChatEngine.from_env(), args.host, args.port)
+    print(f"Serving the chat engine on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
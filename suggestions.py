@@ -0,0 +1,63 @@
+# suggestions.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def history_key(history, model_choice):
+    """Hash of the visible conversation, so an unchanged chat maps to the same entry."""
+    payload = json.dumps(
+        [model_choice] + [[m["role"], m["content"]] for m in history],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SuggestionCache:
+    """Computes follow-up suggestions off the UI thread and remembers them per history hash.
+
+    generate(history, model_choice) is the blocking LLM call; it runs on a small
+    thread pool and its result is stored under the history hash, so reruns that
+    don't change the conversation never trigger another call.
+    """
+
+    def __init__(self, generate, max_entries=512, workers=2):
+        self.generate = generate
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="suggestions")
+
+    def request(self, history, model_choice):
+        """Returns cached suggestions, or None after scheduling them in the background."""
+        key = history_key(history, model_choice)
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+            if key in self.pending:
+                return None
+            self.pending.add(key)
+        # Copy, since the session keeps appending to its message list
+        self.executor.submit(self._run, key, list(history), model_choice)
+        return None
+
+    def _run(self, key, history, model_choice):
+        try:
+            result = self.generate(history, model_choice)
+        except Exception:
+            result = None
+        with self.lock:
+            self.pending.discard(key)
+            if result is None:
+                return
+            self.results[key] = result
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+
+    def close(self):
+        """Drops queued work and stops the worker threads."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# The app is a flat set of modules at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
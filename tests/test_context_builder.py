@@ -0,0 +1,79 @@
+# tests/test_context_builder.py
+from context_builder import DOCUMENT_SHARE, MESSAGE_OVERHEAD, build_context, count_tokens
+
+MODEL = "gpt-3.5-turbo"
+
+
+def turns(count, words=40):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "filler " * words}
+        for i in range(count)
+    ]
+
+
+def message_tokens(message):
+    return count_tokens(message["content"], MODEL) + MESSAGE_OVERHEAD
+
+
+def test_sections_are_packed_in_priority_order():
+    history = turns(12)
+    plan = build_context(
+        MODEL, "You are a bot.", history, summary="They talked about Saturn.",
+        doc_chunks=["[a.txt] Saturn has rings."], budget=400,
+    )
+
+    # The newest turn, the summary and the documents all made it; older turns filled
+    # what was left, newest first, so what was kept is the tail of the history
+    assert plan.history[-1] == history[-1]
+    assert plan.history == history[-len(plan.history):]
+    assert "[CONVERSATION SUMMARY]: They talked about Saturn." in plan.system_prompt
+    assert "[DOCUMENT CONTEXT]:\n[a.txt] Saturn has rings." in plan.system_prompt
+    assert plan.dropped_turns == len(history) - len(plan.history) > 0
+    assert plan.dropped_chunks == 0
+
+
+def test_whole_unsummarized_history_goes_in_when_it_fits():
+    history = turns(30, words=5)
+    plan = build_context(MODEL, "You are a bot.", history)
+    assert plan.history == history
+    assert plan.dropped_turns == 0
+
+
+def test_oversized_newest_turn_is_trimmed_to_the_budget():
+    history = turns(2) + [{"role": "user", "content": "long " * 5000}]
+    plan = build_context(MODEL, "You are a bot.", history, summary="A summary.", budget=200)
+
+    [latest] = plan.history
+    assert latest["role"] == "user"
+    assert latest["content"].startswith("long long")
+    assert len(latest["content"]) < len(history[-1]["content"])
+    assert plan.usage["history"] <= 200 - plan.usage["system"]
+    assert plan.usage["summary"] == 0
+    assert plan.dropped_turns == 2
+
+
+def test_document_chunks_are_capped_at_their_share():
+    history = turns(1, words=5)
+    chunks = [f"[doc.txt] chunk {i} " + "text " * 30 for i in range(50)]
+    plan = build_context(MODEL, "You are a bot.", history, doc_chunks=chunks, budget=1000)
+
+    available = 1000 - plan.usage["system"] - message_tokens(history[0])
+    assert 0 < plan.usage["documents"] <= int(available * DOCUMENT_SHARE)
+    assert plan.dropped_chunks > 0
+    # Ranked order: the best chunks are the ones kept
+    kept = len(chunks) - plan.dropped_chunks
+    assert "\n...\n".join(chunks[:kept]) in plan.system_prompt
+    assert chunks[kept] not in plan.system_prompt
+
+
+def test_usage_adds_up_to_what_is_sent():
+    history = turns(8)
+    plan = build_context(
+        MODEL, "You are a bot.", history, summary="Earlier, Saturn.", doc_chunks=["[a.txt] rings"], budget=600,
+    )
+
+    assert plan.usage["system"] == count_tokens("You are a bot.", MODEL) + MESSAGE_OVERHEAD
+    assert plan.usage["summary"] == count_tokens("\n\n[CONVERSATION SUMMARY]: Earlier, Saturn.", MODEL)
+    assert plan.usage["documents"] == count_tokens("[a.txt] rings", MODEL) + 2
+    assert plan.usage["history"] == sum(message_tokens(m) for m in plan.history)
+    assert plan.total_tokens == sum(plan.usage.values()) <= plan.budget == 600
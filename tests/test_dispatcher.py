@@ -0,0 +1,144 @@
+# tests/test_dispatcher.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from dispatcher import Dispatcher, ProviderLimiter, request_key
+from metrics import MetricsRegistry
+
+
+def make_limiter(max_concurrency=1, rate=1000.0, burst=1000):
+    return ProviderLimiter("openai", max_concurrency, rate, burst, MetricsRegistry())
+
+
+def test_cancel_after_grant_releases_the_slot():
+    limiter = make_limiter()
+
+    async def main():
+        await limiter.aacquire()
+        waiter = asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 1
+
+        # The slot is handed to the waiter, then it is cancelled before it resumes
+        limiter.release()
+        asyncio.get_running_loop().call_soon(waiter.cancel)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        assert limiter.active == 0 and not limiter.waiters
+
+        await asyncio.wait_for(limiter.aacquire(), 1)
+        limiter.release()
+
+    asyncio.run(main())
+
+
+def test_cancel_while_queued_releases_the_slot():
+    limiter = make_limiter()
+
+    async def main():
+        await limiter.aacquire()
+        waiter = asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.sleep(0)
+        assert limiter.active == 0
+
+        await asyncio.wait_for(limiter.aacquire(), 1)
+        limiter.release()
+
+    asyncio.run(main())
+
+
+def test_chat_stream_is_not_delayed_by_queued_background_calls():
+    dispatcher = Dispatcher(MetricsRegistry(), {"gemini": (4, 1000.0, 1000)})
+    release_calls = threading.Event()
+    started = threading.Semaphore(0)
+
+    def background_call(i):
+        def fn():
+            started.release()
+            release_calls.wait(5)
+            return i
+        return dispatcher.call("gemini", request_key("gemini", "suggestions", i), fn, background=True)
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        futures = [pool.submit(background_call, i) for i in range(20)]
+        for _ in range(3):
+            assert started.acquire(timeout=5)
+        limiter = dispatcher.limiters["gemini"]
+        # Background work holds every slot it may use; the rest of the calls queue
+        assert limiter.active_background == 3 and len(limiter.background_waiters) == 17
+
+        start = time.perf_counter()
+        chunks = list(dispatcher.stream("gemini", request_key("gemini", "chat"), lambda: iter(["hello", " world"])))
+        elapsed = time.perf_counter() - start
+
+        release_calls.set()
+        assert sorted(future.result() for future in futures) == list(range(20))
+
+    assert chunks == ["hello", " world"]
+    assert elapsed < 0.5
+    assert limiter.active == 0 and limiter.active_background == 0
+
+
+def test_background_calls_leave_tokens_for_interactive_ones():
+    limiter = ProviderLimiter("gemini", 8, 0.25, 8, MetricsRegistry())
+    for _ in range(6):
+        assert limiter._reserve_token(background=True) == 0.0
+    # Only the interactive reserve is left
+    assert limiter._reserve_token(background=True) > 0
+    assert limiter._reserve_token(background=False) == 0.0
+    assert limiter._reserve_token(background=False) == 0.0
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+def test_long_retry_after_fails_instead_of_waiting():
+    dispatcher = Dispatcher(MetricsRegistry(), max_retry_after=1.0)
+    attempts = []
+
+    def fn():
+        attempts.append(time.perf_counter())
+        raise RateLimited(60)
+
+    start = time.perf_counter()
+    with pytest.raises(RateLimited):
+        dispatcher.call("gemini", request_key("gemini", "long"), fn)
+    assert len(attempts) == 1
+    assert time.perf_counter() - start < 1
+
+
+def test_short_retry_after_is_honoured():
+    dispatcher = Dispatcher(MetricsRegistry(), max_retry_after=1.0)
+    attempts = []
+
+    def fn():
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            raise RateLimited(0.05)
+        return "ok"
+
+    assert dispatcher.call("gemini", request_key("gemini", "short"), fn) == "ok"
+    assert attempts[1] - attempts[0] >= 0.05
+
+
+def test_zero_rate_means_no_rate_limit():
+    limiter = ProviderLimiter("gemini", 4, 0, 1, MetricsRegistry())
+    for _ in range(10):
+        assert limiter._reserve_token(background=False) == 0.0
+        assert limiter._reserve_token(background=True) == 0.0
@@ -0,0 +1,151 @@
+# tests/test_document_library.py
+import io
+import os
+import threading
+
+import pytest
+
+from document_library import DocumentLibrary, DocumentStore
+
+
+class Upload(io.BytesIO):
+    """Just enough of Streamlit's UploadedFile for the store."""
+
+    def __init__(self, data, type, name="file"):
+        super().__init__(data)
+        self.type = type
+        self.name = name
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents"))
+    yield store
+    store.close()
+
+
+def test_unsupported_type_is_marked_failed(store):
+    key = store.add(Upload(b"# notes", "application/octet-stream", "notes.md"))
+    status, detail = store.status(key)
+    assert status == "failed"
+    assert "unsupported file type" in detail
+
+    library = DocumentLibrary(store, [("notes.md", key)])
+    assert not library.pending()
+    assert library.top_chunks("notes") == []
+
+
+def test_text_upload_is_ingested(store):
+    key = store.add(Upload(b"The refund window is 30 days.", "text/plain"))
+    store.wait(key, timeout=10)
+    assert store.status(key)[0] == "ready"
+    assert DocumentLibrary(store, [("policy.txt", key)]).top_chunks("refund") == [
+        "[policy.txt] The refund window is 30 days."
+    ]
+
+
+def ingest(store, text):
+    key = store.add(Upload(text.encode("utf-8"), "text/plain"))
+    store.wait(key, timeout=10)
+    return key
+
+
+def test_store_evicts_least_recently_used_documents(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents"), max_documents=2)
+    try:
+        first = ingest(store, "first document")
+        second = ingest(store, "second document")
+        store.index(first)  # first is now the most recently used
+        third = ingest(store, "third document")
+
+        assert store.status(second)[0] == "evicted"
+        assert not os.path.exists(store.text_path(second))
+        assert store.size(second) is None
+        assert store.status(first)[0] == "ready" and store.status(third)[0] == "ready"
+        assert len(store.states) == 2 and not store.jobs
+        assert store.total_bytes == len("first document") + len("third document")
+
+        # Adding the file again brings it back
+        assert ingest(store, "second document") == second
+        assert store.status(second)[0] == "ready"
+    finally:
+        store.close()
+
+
+def test_store_limits_bytes_and_counts_existing_files(tmp_path):
+    root = str(tmp_path / "documents")
+    store = DocumentStore(root, max_bytes=25)
+    try:
+        keys = [ingest(store, f"document number {i}") for i in range(3)]
+        assert [store.status(key)[0] for key in keys] == ["evicted", "evicted", "ready"]
+        assert store.total_bytes <= 25
+    finally:
+        store.close()
+
+    # A new process sharing the root picks up what is on disk
+    store = DocumentStore(root, max_bytes=25)
+    try:
+        assert store.status(keys[2])[0] == "ready"
+        assert store.total_bytes == len("document number 2")
+    finally:
+        store.close()
+
+
+def test_truncated_document_says_so(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents"), max_chars=100)
+    try:
+        long_key = ingest(store, "word " * 100)
+        short_key = ingest(store, "just a few words")
+        exact_key = ingest(store, "x" * 100)
+        one_over_key = ingest(store, "y" * 101)
+        status, detail = store.status(long_key)
+        assert status == "ready" and "truncated to the first 100 characters" in detail
+        assert store.size(long_key) == 100
+        assert store.status(short_key) == ("ready", "")
+        assert store.status(exact_key) == ("ready", "")
+        assert "truncated" in store.status(one_over_key)[1]
+    finally:
+        store.close()
+
+
+def test_index_cache_is_bounded_by_size_and_rebuilt_in_the_background(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents"), workers=1, max_index_bytes=1)
+    try:
+        first = ingest(store, "the refund window is 30 days")
+        second = ingest(store, "shipping takes a week")
+        assert list(store.indexes) == [second]
+        assert store.index_bytes == store.indexes[second].nbytes
+
+        # Hold the only ingestion worker so the rebuild stays queued
+        gate = threading.Event()
+        store.executor.submit(gate.wait)
+        # The chat turn skips the document instead of building its index inline
+        library = DocumentLibrary(store, [("policy.txt", first)])
+        assert library.top_chunks("refund") == []
+        job = store.jobs[first]
+        assert library.top_chunks("refund") == []
+        assert store.jobs[first] is job
+
+        gate.set()
+        store.wait(first, timeout=10)
+        assert library.top_chunks("refund") == ["[policy.txt] the refund window is 30 days"]
+    finally:
+        store.close()
+
+
+def test_documents_from_an_earlier_process_are_indexed_in_the_background(tmp_path):
+    root = str(tmp_path / "documents")
+    store = DocumentStore(root)
+    try:
+        key = ingest(store, "the refund window is 30 days")
+    finally:
+        store.close()
+
+    store = DocumentStore(root)
+    try:
+        library = DocumentLibrary(store, [("policy.txt", key)])
+        assert library.top_chunks("refund") == []
+        store.wait(key, timeout=10)
+        assert library.top_chunks("refund") == ["[policy.txt] the refund window is 30 days"]
+    finally:
+        store.close()
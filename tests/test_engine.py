@@ -0,0 +1,205 @@
+# tests/test_engine.py
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from engine import GEMINI_CHOICE, MODEL_NAMES, OPENAI_CHOICE, ChatEngine, ChatSession
+
+
+def fake_stream(chunks):
+    async def astream_turn(plan, fastest=False):
+        for chunk in chunks:
+            await asyncio.sleep(0)
+            yield chunk
+    return astream_turn
+
+
+def test_closing_achat_mid_stream_rolls_the_turn_back():
+    engine = ChatEngine(openai_key="unused")
+    engine.astream_turn = fake_stream(["one", " two", " three"])
+    session = ChatSession()
+
+    async def main():
+        turn = engine.achat(session, "qzx tell me something wvk")
+        assert await turn.__anext__() == "one"
+        await turn.aclose()
+
+    asyncio.run(main())
+    assert [m["role"] for m in session.messages] == ["system"]
+    assert engine.metrics.counters[("abandoned", "gpt-3.5-turbo")] == 1
+    engine.close()
+
+
+def test_finished_achat_stores_the_answer_without_prefetching_suggestions():
+    engine = ChatEngine(openai_key="unused")
+    engine.astream_turn = fake_stream(["one", " two"])
+    session = ChatSession()
+
+    async def main():
+        return [chunk async for chunk in engine.achat(session, "qzx tell me something wvk")]
+
+    assert asyncio.run(main()) == ["one", " two"]
+    assert [m["role"] for m in session.messages] == ["system", "user", "assistant"]
+    assert session.messages[-1]["content"] == "one two"
+    assert not engine.suggestions.pending and not engine.suggestions.results
+    engine.close()
+
+
+def test_warm_up_builds_each_client_once_and_skips_missing_keys():
+    engine = ChatEngine(openai_key="unused")
+    engine.warm_up(GEMINI_CHOICE)
+    assert not engine.warmed
+
+    for _ in range(3):
+        engine.warm_up(OPENAI_CHOICE)
+    assert engine.warmed == {"openai"}
+    for thread in threading.enumerate():
+        if thread.name == "warm-openai":
+            thread.join(30)
+    assert "openai" in engine.clients
+    engine.close()
+
+
+def chat_session(length):
+    session = ChatSession()
+    for i in range(1, length):
+        session.messages.append({"role": "user" if i % 2 else "assistant", "content": f"message {i}"})
+    return session
+
+
+def run_summary_job(engine, session):
+    engine.update_rolling_summary(session, OPENAI_CHOICE)
+    session.summary_job[1].result(30)
+    engine.update_rolling_summary(session, OPENAI_CHOICE)
+
+
+def test_failed_summary_does_not_advance_and_is_retried():
+    engine = ChatEngine(openai_key="unused")
+    results = [None, "retried"]
+    engine.compress_memory = lambda new_messages, previous_summary, model_choice: results.pop(0)
+    session = chat_session(20)
+
+    run_summary_job(engine, session)
+    assert session.summarized_upto == 1
+    assert session.chat_summary == ""
+    # The same range is resubmitted on the next turn
+    assert session.summary_job[0] == 20 - 10
+
+    session.summary_job[1].result(30)
+    engine.update_rolling_summary(session, OPENAI_CHOICE)
+    assert session.summarized_upto == 10
+    assert session.chat_summary == "retried"
+    engine.close()
+
+
+def test_truncating_history_below_the_summary_resets_it():
+    engine = ChatEngine(openai_key="unused")
+    engine.compress_memory = lambda new_messages, previous_summary, model_choice: "summary"
+    session = chat_session(20)
+    run_summary_job(engine, session)
+    assert session.summarized_upto == 10
+
+    engine.truncate_history(session, 19)
+    assert session.summarized_upto == 10 and session.chat_summary == "summary"
+
+    engine.truncate_history(session, 5)
+    assert len(session.messages) == 5
+    assert session.summarized_upto == 1
+    assert session.chat_summary == ""
+    assert session.summary_job is None
+    engine.close()
+
+
+def test_summary_job_for_truncated_messages_is_discarded():
+    engine = ChatEngine(openai_key="unused")
+    engine.compress_memory = lambda new_messages, previous_summary, model_choice: "summary"
+    session = chat_session(20)
+    engine.update_rolling_summary(session, OPENAI_CHOICE)
+    session.summary_job[1].result(30)
+
+    # Cut directly, as older callers do, below the range the job summarized
+    session.messages = session.messages[:8]
+    engine.update_rolling_summary(session, OPENAI_CHOICE)
+    assert session.summarized_upto == 1
+    assert session.chat_summary == ""
+    engine.close()
+
+
+def test_failed_preparation_takes_the_message_back():
+    engine = ChatEngine(openai_key="unused")
+
+    def broken_get(key):
+        raise sqlite3.OperationalError("database is locked")
+
+    engine.response_cache.get = broken_get
+    session = ChatSession()
+
+    async def main():
+        return [chunk async for chunk in engine.achat(session, "zzqx plorv")]
+
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(main())
+    assert [m["role"] for m in session.messages] == ["system"]
+    engine.close()
+
+
+def hedged_engine():
+    engine = ChatEngine(openai_key="unused", google_key="unused", hedge_delay=0.01)
+    stalled = threading.Event()
+
+    def slow_openai(messages):
+        stalled.wait(5)
+        return iter(["openai answer"])
+
+    async def slow_openai_async(messages):
+        await asyncio.sleep(5)
+        yield "openai answer"
+
+    async def gemini_async(contents, system_instruction):
+        yield "gemini answer"
+
+    engine.openai_stream = slow_openai
+    engine.gemini_stream = lambda contents, system_instruction: iter(["gemini answer"])
+    engine.openai_astream = slow_openai_async
+    engine.gemini_astream = gemini_async
+    return engine, stalled
+
+
+def test_hedge_won_by_the_other_provider_is_not_cached_under_the_chosen_model():
+    engine, stalled = hedged_engine()
+    session = ChatSession()
+    plan = engine.prepare_turn(session, "zzqx plorv", "Witty & Spicy", OPENAI_CHOICE)
+    answer = "".join(engine.stream_turn(plan, fastest=True))
+    stalled.set()
+    engine.complete_turn(session, plan, answer, prefetch_suggestions=False)
+
+    assert answer == "gemini answer"
+    assert plan.provider == GEMINI_CHOICE
+    assert engine.response_cache.get(plan.response_key) is None
+    assert ("stream", MODEL_NAMES[GEMINI_CHOICE]) in engine.metrics.latency
+    assert engine.metrics.tokens[(MODEL_NAMES[GEMINI_CHOICE], "completion")] > 0
+    engine.close()
+
+
+def test_async_hedge_records_its_winner():
+    engine, _ = hedged_engine()
+    session = ChatSession()
+
+    async def main():
+        return [chunk async for chunk in engine.achat(session, "zzqx plorv", fastest=True)]
+
+    assert asyncio.run(main()) == ["gemini answer"]
+    assert engine.response_cache.stats()["entries"] == 0
+    assert ("stream", MODEL_NAMES[GEMINI_CHOICE]) in engine.metrics.latency
+    engine.close()
+
+
+def test_context_gets_every_unsummarized_turn():
+    engine = ChatEngine(openai_key="unused")
+    session = chat_session(14)
+    plan = engine.prepare_turn(session, "zzqx plorv", "Witty & Spicy", OPENAI_CHOICE)
+    assert plan.context_plan.history == session.messages[1:]
+    assert len(plan.context_plan.history) == 14
+    engine.close()
@@ -0,0 +1,30 @@
+# tests/test_extraction.py
+import os
+
+import pytest
+
+import extraction
+
+fitz = pytest.importorskip("fitz")
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    document = fitz.open()
+    for number in range(extraction.PARALLEL_MIN_PAGES + 8):
+        document.new_page().insert_text((72, 72), f"page {number}")
+    path = str(tmp_path / "document.pdf")
+    document.save(path)
+    document.close()
+    return path
+
+
+def test_dead_worker_pool_is_replaced(pdf_path):
+    broken = extraction.get_process_pool()
+    with pytest.raises(Exception):
+        broken.submit(os.abort).result(30)
+
+    pages = list(extraction.iter_pdf_pages(pdf_path))
+    assert [page.strip() for page in pages] == [f"page {number}" for number in range(len(pages))]
+    assert len(pages) == extraction.PARALLEL_MIN_PAGES + 8
+    assert extraction.get_process_pool() is not broken
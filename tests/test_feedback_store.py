@@ -0,0 +1,77 @@
+# tests/test_feedback_store.py
+import logging
+import sqlite3
+import threading
+import time
+
+from feedback_store import WRITE_ATTEMPTS, FeedbackStore
+
+
+def make_store(tmp_path):
+    return FeedbackStore(str(tmp_path / "feedback.sqlite3"), flush_interval=0.01, retry_delay=0.01)
+
+
+def test_failed_write_is_retried(tmp_path, caplog):
+    store = make_store(tmp_path)
+    write = store._write
+    failures = []
+
+    def flaky_write(conn, batch):
+        if not failures:
+            failures.append(True)
+            raise sqlite3.OperationalError("database is locked")
+        write(conn, batch)
+
+    store._write = flaky_write
+    with caplog.at_level(logging.WARNING, logger="feedback_store"):
+        store.record("s1", 2, "gpt", "prompt", "response", "up")
+        assert store.flush(timeout=5)
+    assert store.written == 1 and store.dropped == 0
+    assert store.summary() == [("gpt", "up", 1)]
+    assert "retrying" in caplog.text
+
+
+def test_batch_is_dropped_and_logged_after_repeated_failures(tmp_path, caplog):
+    store = make_store(tmp_path)
+    attempts = []
+
+    def broken_write(conn, batch):
+        attempts.append(len(batch))
+        raise sqlite3.OperationalError("disk I/O error")
+
+    store._write = broken_write
+    with caplog.at_level(logging.WARNING, logger="feedback_store"):
+        store.record("s1", 2, "gpt", "prompt", "response", "down")
+        assert store.flush(timeout=5)
+    assert len(attempts) == WRITE_ATTEMPTS
+    assert store.dropped == 1
+    assert "Dropped 1 feedback events" in caplog.text
+
+    # The writer survives and keeps writing later batches
+    store._write = FeedbackStore._write.__get__(store)
+    store.record("s1", 4, "gpt", "prompt", "response", "up")
+    assert store.flush(timeout=5)
+    assert store.written == 1
+
+
+def test_flush_does_not_hang_when_the_writer_is_dead(tmp_path):
+    store = make_store(tmp_path)
+    store.writer = threading.Thread(target=lambda: None)
+    store.writer.start()
+    store.writer.join()
+    store.queue.put(("s1", 2, time.time(), "gpt", "up", "prompt", "response"))
+
+    start = time.perf_counter()
+    assert store.flush() is False
+    assert time.perf_counter() - start < 1
+
+
+def test_flush_times_out(tmp_path):
+    store = make_store(tmp_path)
+    release = threading.Event()
+    store._write = lambda conn, batch: release.wait(5)
+    store.record("s1", 2, "gpt", "prompt", "response", "up")
+
+    assert store.flush(timeout=0.2) is False
+    release.set()
+    assert store.flush(timeout=5)
@@ -0,0 +1,85 @@
+# tests/test_hedging.py
+import os
+import sys
+import threading
+import time
+
+from dispatcher import Dispatcher, request_key
+from hedging import HedgedStream
+from metrics import MetricsRegistry
+from providers import openai_text_stream, track_response
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from mock_llm_server import MockConfig, MockLLMServer
+
+
+class StalledStream:
+    """Never produces a token until aborted, like a provider stuck before its first byte."""
+
+    def __init__(self):
+        self.aborted = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.aborted.wait(10)
+        raise StopIteration
+
+    def abort(self):
+        self.aborted.set()
+
+
+def test_loser_is_aborted_as_soon_as_the_winner_is_known():
+    stalled = StalledStream()
+    stream = HedgedStream([("slow", lambda: stalled), ("fast", lambda: iter(["hi", " there"]))], hedge_delay=0.05)
+    chunks = iter(stream)
+    assert next(chunks) == "hi"
+    assert stalled.aborted.is_set()
+    assert stream.provider == "fast"
+    assert list(chunks) == [" there"]
+
+
+def test_aborting_a_dispatcher_stream_frees_its_slot():
+    dispatcher = Dispatcher(MetricsRegistry(), {"openai": (1, 1000.0, 1000)})
+    stalled = StalledStream()
+    reader = dispatcher.stream("openai", request_key("openai", "chat"), lambda: stalled)
+    result = []
+    thread = threading.Thread(target=lambda: result.extend(reader))
+    thread.start()
+    time.sleep(0.05)
+    assert dispatcher.limiters["openai"].active == 1
+
+    reader.abort()
+    thread.join(1)
+    assert not thread.is_alive() and result == []
+    assert stalled.aborted.wait(1)
+    for _ in range(100):
+        if dispatcher.limiters["openai"].active == 0:
+            break
+        time.sleep(0.01)
+    assert dispatcher.limiters["openai"].active == 0 and not dispatcher.flights
+
+
+def test_abort_wakes_a_reader_blocked_before_the_first_token():
+    import httpx
+    from openai import OpenAI
+
+    with MockLLMServer(MockConfig(first_token_delay=5.0)) as mock:
+        client = OpenAI(
+            api_key="mock", base_url=f"{mock.url}/v1", max_retries=0,
+            http_client=httpx.Client(event_hooks={"response": [track_response]}),
+        )
+        stream = openai_text_stream(client, "gpt-3.5-turbo", [{"role": "user", "content": "hi"}])
+        result = []
+        thread = threading.Thread(target=lambda: result.extend(stream))
+        thread.start()
+        time.sleep(0.3)
+
+        start = time.perf_counter()
+        stream.abort()
+        thread.join(2)
+        assert not thread.is_alive()
+        assert time.perf_counter() - start < 1.0
+        assert result == []
@@ -0,0 +1,15 @@
+# tests/test_metrics.py
+from metrics import MetricsRegistry
+
+
+def stages(registry):
+    return {stage for stage, _, _, _, _, _ in registry.stage_summary()}
+
+
+def test_replayed_answers_do_not_count_towards_first_token():
+    registry = MetricsRegistry()
+    assert list(registry.turn("gpt").stream(iter(["cached ", "answer"]), replay=True)) == ["cached ", "answer"]
+    assert stages(registry) == {"cache_replay"}
+
+    list(registry.turn("gpt").stream(iter(["live"])))
+    assert stages(registry) == {"cache_replay", "first_token", "stream"}
@@ -0,0 +1,89 @@
+# tests/test_response_cache.py
+import pytest
+
+import response_cache
+from response_cache import MemoryBackend, ResponseCache, SQLiteBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make(max_entries=100):
+        if request.param == "memory":
+            return MemoryBackend(max_entries)
+        return SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries)
+    return make
+
+
+def test_entries_expire_after_the_ttl(make_backend, clock):
+    backend = make_backend()
+    backend.put("key", "answer")
+    clock.advance(59)
+    assert backend.get("key", ttl=60) == "answer"
+    clock.advance(2)
+    assert backend.get("key", ttl=60) is None
+    # The expired entry is deleted, not just hidden
+    assert len(backend) == 0
+
+
+def test_least_recently_used_entry_is_evicted(make_backend, clock):
+    backend = make_backend(max_entries=2)
+    backend.put("first", "1")
+    clock.advance(1)
+    backend.put("second", "2")
+    clock.advance(1)
+    assert backend.get("first", ttl=60) == "1"  # first is now the most recently used
+    clock.advance(1)
+    backend.put("third", "3")
+
+    assert len(backend) == 2
+    assert backend.get("second", ttl=60) is None
+    assert backend.get("first", ttl=60) == "1"
+    assert backend.get("third", ttl=60) == "3"
+
+
+def test_sqlite_eviction_keeps_the_newest_max_entries(tmp_path, clock):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    for i in range(10):
+        backend.put(f"key {i}", str(i))
+        clock.advance(1)
+    assert len(backend) == 3
+    assert [backend.get(f"key {i}", ttl=60) for i in range(10)] == [None] * 7 + ["7", "8", "9"]
+
+
+def test_sqlite_backends_on_one_file_share_entries(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    first.put("key", "answer")
+    assert second.get("key", ttl=60) == "answer"
+    second.put("other", "reply")
+    assert first.get("other", ttl=60) == "reply"
+    assert len(first) == len(second) == 2
+
+
+def test_stats_count_hits_and_misses(clock):
+    cache = ResponseCache(MemoryBackend(), ttl=60)
+    assert cache.get("key") is None
+    cache.put("key", "answer")
+    assert cache.get("key") == "answer"
+    assert cache.get("key") == "answer"
+    clock.advance(61)
+    assert cache.get("key") is None
+    assert cache.stats() == {"hits": 2, "misses": 2, "entries": 0}
@@ -0,0 +1,49 @@
+# tests/test_retrieval.py
+import random
+
+import pytest
+
+from retrieval import DocumentIndex
+
+UNICODE_SPACES = ["\xa0", "\x85", "\u1680", "\u2003", "\u200a", "\u2028", "\u202f", "\u205f", "\u3000", "\x1c"]
+
+
+def chunk_text(text, chunk_words=150, overlap_words=30):
+    """The str-based chunker DocumentIndex replaced, kept as the reference."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_words - overlap_words, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+def chunks_of(index):
+    return [index.chunk(i) for i in range(len(index))]
+
+
+def test_nbsp_separated_words_chunk_like_str_split():
+    text = "\xa0".join(f"word{i}" for i in range(300))
+    index = DocumentIndex(text)
+    assert len(index) == 3
+    assert chunks_of(index) == chunk_text(text)
+
+
+@pytest.mark.parametrize("separator", UNICODE_SPACES)
+def test_unicode_spaces_split_words(separator):
+    text = separator.join(["café", "naïve", "日本語", "refund"] * 100)
+    assert chunks_of(DocumentIndex(text)) == chunk_text(text)
+
+
+def test_mixed_text_matches_reference_for_bytes_source():
+    rng = random.Random(7)
+    words = ["refund", "policy", "café", "日本語", "ok", "été", "emoji\U0001f600", "x"]
+    separators = [" ", "\n", "\t", "  "] + UNICODE_SPACES
+    text = "".join(rng.choice(words) + rng.choice(separators) for _ in range(2000))
+    index = DocumentIndex(text.encode("utf-8"))
+    assert chunks_of(index) == chunk_text(text)
+    assert index.search("refund policy")
@@ -0,0 +1,124 @@
+# tests/test_server.py
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from engine import ChatEngine
+from server import ChatServer
+
+
+async def send(server, raw):
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+def post(body, content_length=None):
+    if content_length is None:
+        content_length = str(len(body))
+    return (
+        f"POST /v1/chat HTTP/1.1\r\nHost: test\r\nContent-Length: {content_length}\r\n\r\n".encode("latin-1") + body
+    )
+
+
+def run(requests):
+    async def main():
+        server = await ChatServer(ChatEngine(), port=0).start()
+        try:
+            return [await send(server, raw) for raw in requests]
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("content_length", ["abc", "-5", "1.5"])
+def test_bad_content_length_is_400(content_length):
+    [(status, body)] = run([post(b"{}", content_length)])
+    assert status == 400
+    assert json.loads(body) == {"error": "Invalid Content-Length"}
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b"42", b'"hello"', b"null", b"\xff\xfe"])
+def test_body_that_is_not_a_json_object_is_400(body):
+    [(status, _)] = run([post(body)])
+    assert status == 400
+
+
+@pytest.mark.parametrize("request_body", [
+    {"message": "hi", "session_id": ["a"]},
+    {"message": "hi", "model": ["openai"]},
+    {"message": "hi", "personality": 3},
+    {"message": 5},
+])
+def test_fields_of_the_wrong_type_are_400(request_body):
+    [(status, _)] = run([post(json.dumps(request_body).encode())])
+    assert status == 400
+
+
+def test_server_keeps_serving_after_bad_requests():
+    responses = run([post(b"[]"), post(b"{}", "-1"), b"GET /healthz HTTP/1.1\r\n\r\n"])
+    assert [status for status, _ in responses] == [400, 400, 200]
+
+
+def test_client_disconnect_mid_stream_rolls_the_turn_back():
+    engine = ChatEngine(openai_key="unused")
+
+    async def endless(plan, fastest=False):
+        for i in range(10000):
+            await asyncio.sleep(0.001)
+            yield f"chunk {i} "
+
+    engine.astream_turn = endless
+
+    async def main():
+        server = await ChatServer(engine, port=0).start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(post(json.dumps({"message": "qzx tell me something wvk", "session_id": "s1"}).encode()))
+            await writer.drain()
+            await reader.readuntil(b"event: token")
+            writer.close()
+
+            session, lock = server.sessions.get("s1")
+            for _ in range(500):
+                await asyncio.sleep(0.01)
+                if not lock.locked():
+                    break
+            return session
+        finally:
+            await server.close()
+
+    session = asyncio.run(main())
+    assert [m["role"] for m in session.messages] == ["system"]
+    engine.close()
+
+
+def test_failed_turn_sends_an_error_event_and_rolls_back():
+    engine = ChatEngine(openai_key="unused")
+
+    def broken_get(key):
+        raise sqlite3.OperationalError("database is locked")
+
+    engine.response_cache.get = broken_get
+
+    async def main():
+        server = await ChatServer(engine, port=0).start()
+        try:
+            body = json.dumps({"message": "zzqx plorv", "session_id": "s1"}).encode()
+            response = await send(server, post(body))
+            return response, server.sessions.get("s1")[0]
+        finally:
+            await server.close()
+
+    (status, body), session = asyncio.run(main())
+    assert status == 200
+    assert body == b'event: error\ndata: {"error": "database is locked"}\n\n'
+    assert [m["role"] for m in session.messages] == ["system"]
+    engine.close()